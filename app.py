@@ -1,9 +1,13 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from jinja2.ext import debug
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
 import os
+import re
 import json
 import sys
 
@@ -12,24 +16,48 @@ project_root = os.path.dirname(os.path.abspath(__file__))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from settings import ALGO_PORT, ALGO_HOST
-from components.processVideo import download_video, extract_bv_and_p_from_url, get_video_info, get_video_cid_aid, video2audio
-from components.getSubtitle import get_subtitle_from_bilibili, get_subtitle_from_ai
+from settings import (
+    ALGO_PORT, ALGO_HOST, VIDEO_CACHE_SIZE_MB, VIDEO_PROGRESSIVE, VIDEO_PREFETCH, PREFETCH_QUEUE_SIZE,
+    PIPELINE_DOWNLOAD_CONCURRENCY, PIPELINE_AUDIO_CONCURRENCY, PIPELINE_ASR_CONCURRENCY,
+    PIPELINE_NOTES_CONCURRENCY, PIPELINE_QUIZ_CONCURRENCY, PIPELINE_RETRIES
+)
+from components.processVideo import (
+    adownload_video, adownload_audio, extract_bv_and_p_from_url, aget_video_info, get_video_cid_aid, avideo2audio,
+    get_download_state
+)
+from components.getSubtitle import aget_subtitle_from_bilibili, aget_subtitle_from_ai
 from components.getAIContent import get_ai_notes, get_ai_quiz
+from components.singleFlight import SingleFlight
+from components.orchestrator import Orchestrator, Stage
+from components.videoCache import VideoCache
+from components.rangeResponse import RangeFileResponse, GrowingFileResponse
+from components.asyncUtils import run_blocking
 from components.dbOperations import (
-    get_course_series, create_course_series, 
-    get_course_parts, create_course_part, update_course_part
+    get_course_series, create_course_series,
+    get_course_parts, create_course_part, update_course_part,
+    get_quizzes, create_quiz
 )
 
 def get_file_path(filename):
     """Get absolute path for a file in the project"""
     return os.path.join(project_root, filename)
 
+def get_video_path(bv_number, p_number):
+    file_suffix = f"_p{p_number}" if p_number > 1 else ""
+    return get_file_path(f"bilibili_video/{bv_number}{file_suffix}.mp4")
+
 class URLRequest(BaseModel):
     url: str
     cookie: str
+    prefetch: Optional[bool] = None  # 仅/video使用，不传时按VIDEO_PREFETCH
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 继续上次退出时未完成的流水线任务
+    pipeline.recover()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
@@ -40,11 +68,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按(分P, 产物)合并并发的下载和生成任务，文件锁使同一主机上的多个worker进程也不会重复执行
+single_flight = SingleFlight(get_file_path("bilibili_video/.locks"))
+# 本地视频目录的磁盘配额，超出时淘汰最久未播放的分P
+video_cache = VideoCache(get_file_path("bilibili_video"), VIDEO_CACHE_SIZE_MB * 1024 * 1024)
+
+# 已在后台运行、请求返回后仍需继续的任务，保留引用以免被回收
+background_tasks = set()
+
+def run_in_background(coro):
+    """在后台运行协程，不随发起它的请求结束或取消"""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(finish_background_task)
+    return task
+
+def finish_background_task(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"后台任务失败: {task.exception()}")
+
 async def ensure_bilibili_video_exists(bv_number: str, meta_data: dict) -> str:
     """确保课程系列和分P信息存在于数据库中"""
-    series = get_course_series(unique_id=bv_number)
+    series = await run_in_threadpool(get_course_series, unique_id=bv_number)
     if not series:
-        series = create_course_series(
+        series = await run_in_threadpool(
+            create_course_series,
             unique_id=bv_number,
             title=meta_data['title'],
             description=meta_data['desc'],
@@ -55,7 +104,8 @@ async def ensure_bilibili_video_exists(bv_number: str, meta_data: dict) -> str:
         )
         series_id = series['series_id']
         for page in meta_data['pages']:
-            create_course_part(
+            await run_in_threadpool(
+                create_course_part,
                 series_id=series_id,
                 title=page['part'],
                 page=page['page'],
@@ -65,13 +115,262 @@ async def ensure_bilibili_video_exists(bv_number: str, meta_data: dict) -> str:
         series_id = series[0]['series_id']
     return series_id
 
+async def get_series_id(bv_number: str) -> str:
+    series = await run_in_threadpool(get_course_series, unique_id=bv_number)
+    if series:
+        return series[0]['series_id']
+    meta_data = await aget_video_info(bv_number)
+    return await ensure_bilibili_video_exists(bv_number, meta_data)
+
 async def get_part_info(series_id: str, page_number: int) -> dict:
-    parts = get_course_parts(series_id=series_id)
+    parts = await run_in_threadpool(get_course_parts, series_id=series_id)
     for part in parts:
         if part['page'] == page_number:
             return part
     return None
 
+async def reload_part_info(part_info: dict) -> dict:
+    """从数据库刷新分P信息；等到锁之后，产物可能已由其他请求或进程生成"""
+    parts = await run_in_threadpool(get_course_parts, part_id=part_info['part_id'])
+    if parts:
+        part_info.update(parts[0])
+    return part_info
+
+async def set_part_status(part_info: dict, status: int):
+    await run_in_threadpool(update_course_part, part_info['part_id'], {'status': status})
+    part_info['status'] = status
+
+async def trim_video_cache(keep=()):
+    """淘汰超出磁盘配额的本地文件，并把被删除视频的分P状态重置为未下载"""
+    for bv_number, p_number in await run_blocking(video_cache.evict, keep=keep):
+        series = await run_in_threadpool(get_course_series, unique_id=bv_number)
+        if not series:
+            continue
+        part_info = await get_part_info(series[0]['series_id'], p_number)
+        if part_info and (part_info.get('status') or 0) >= 2:
+            await set_part_status(part_info, 0)
+
+async def ensure_video(url: str, cookie: str, part_info: dict) -> str:
+    """
+    确保分P视频已下载到本地，返回视频路径，下载失败返回None
+
+    status >= 2 表示视频已下载；重新下载完成后保留原有的字幕/笔记进度。
+    同一分P的并发请求（包括其他worker进程）只下载一次，其余请求等待并复用结果
+    """
+    bv_number, p_number = extract_bv_and_p_from_url(url)
+    video_path = get_video_path(bv_number, p_number)
+    if (part_info.get('status') or 0) >= 2 and os.path.exists(video_path):  # 已下载
+        return video_path
+
+    async def download():
+        await reload_part_info(part_info)
+        status = part_info.get('status') or 0
+        if status >= 2 and os.path.exists(video_path):  # 等锁期间已由其他请求下载完成
+            return video_path
+        await set_part_status(part_info, 1)
+        print(f"视频不存在或未下载完成，开始下载: {url}")
+        try:
+            downloaded = await adownload_video(url, cookie)
+        except Exception:
+            await set_part_status(part_info, 0)
+            raise
+        if not downloaded:
+            await set_part_status(part_info, 0)
+            return None
+        await set_part_status(part_info, max(status, 2))
+        await trim_video_cache(keep=[(bv_number, p_number)])
+        return video_path
+
+    return await single_flight.run((part_info['part_id'], 'video'), download)
+
+async def fetch_bilibili_subtitle(url: str, cookie: str):
+    bv_number, p_number = extract_bv_and_p_from_url(url)
+    meta_data = await aget_video_info(bv_number)
+    cid, aid = get_video_cid_aid(meta_data, p_number)
+    return await aget_subtitle_from_bilibili(aid, cid, cookie)
+
+async def extract_audio(url: str, cookie: str, part_info: dict) -> str:
+    """
+    准备ASR用的音频：视频已下载时从视频中提取，否则只拉取音频流，失败再退回下载整个视频
+
+    同一分P同时只有一个请求在获取音频，避免/subtitle等接口与流水线同时写同一个音频文件
+    """
+    async def acquire():
+        bv_number, p_number = extract_bv_and_p_from_url(url)
+        video_path = get_video_path(bv_number, p_number)
+        if os.path.exists(video_path):
+            audio_path = await avideo2audio(video_path)
+        else:
+            audio_path = await adownload_audio(url, cookie)
+            if not audio_path:
+                if not await ensure_video(url, cookie, part_info):
+                    raise HTTPException(status_code=500, detail="视频下载失败")
+                audio_path = await avideo2audio(video_path)
+        if not audio_path:
+            raise HTTPException(status_code=500, detail="提取音频失败")
+        return audio_path
+
+    return await single_flight.run((part_info['part_id'], 'audio'), acquire)
+
+async def save_subtitle(part_info: dict, subtitle):
+    # 更新数据库中的字幕信息
+    part_info['subtitle'] = json.dumps(subtitle, ensure_ascii=False)  # 直接存储整个字幕数据
+    await run_in_threadpool(update_course_part, part_info['part_id'], {
+        'subtitle': part_info['subtitle']
+    })
+
+async def ensure_subtitle(url: str, cookie: str, part_info: dict):
+    """
+    确保分P的字幕已生成并写入数据库，优先使用B站字幕，没有时用ASR识别音频；无法获取时返回None
+
+    同一分P同时只有一个请求在生成字幕
+    """
+    # 检查数据库中是否已有字幕
+    if part_info.get('subtitle'):
+        return json.loads(part_info['subtitle'])
+
+    async def generate():
+        await reload_part_info(part_info)
+        if part_info.get('subtitle'):
+            return json.loads(part_info['subtitle'])
+        subtitle = await fetch_bilibili_subtitle(url, cookie)
+        if not subtitle:
+            audio_path = await extract_audio(url, cookie, part_info)
+            subtitle = await aget_subtitle_from_ai(audio_path)
+            await trim_video_cache(keep=[extract_bv_and_p_from_url(url)])
+        if not subtitle:
+            return None
+        await save_subtitle(part_info, subtitle)
+        return subtitle
+
+    return await single_flight.run((part_info['part_id'], 'subtitle'), generate)
+
+async def ensure_notes(part_info: dict, subtitle_data) -> str:
+    """确保分P的默认笔记已生成并写入数据库，同一分P同时只有一个请求调用大模型"""
+    if part_info.get('default_note'):
+        return part_info['default_note']
+
+    async def generate():
+        await reload_part_info(part_info)
+        if part_info.get('default_note'):
+            return part_info['default_note']
+        notes = await run_in_threadpool(get_ai_notes, subtitle_data)
+        await run_in_threadpool(update_course_part, part_info['part_id'], {
+            'default_note': notes
+        })
+        part_info['default_note'] = notes
+        return notes
+
+    return await single_flight.run((part_info['part_id'], 'notes'), generate)
+
+async def ensure_quiz(part_info: dict, subtitle_data) -> str:
+    """确保分P的题目已生成；出题结果整体存为quiz表中该分P的一条记录"""
+    async def generate():
+        quizzes = await run_in_threadpool(get_quizzes, part_id=part_info['part_id'])
+        if quizzes:
+            return quizzes[0]['question_text']
+        quiz = await run_in_threadpool(get_ai_quiz, subtitle_data)
+        await run_in_threadpool(create_quiz, part_info['part_id'], quiz, None, None)
+        return quiz
+
+    return await single_flight.run((part_info['part_id'], 'quiz'), generate)
+
+async def load_part(context: dict) -> dict:
+    parts = await run_in_threadpool(get_course_parts, part_id=context['part_id'])
+    if not parts:
+        raise RuntimeError("未找到对应的分P信息")
+    return parts[0]
+
+async def sync_part_status(part_info: dict):
+    """视频已下载时，把字幕、笔记的完成情况写入status（3:字幕已生成、4:笔记已生成）"""
+    await reload_part_info(part_info)  # 其他阶段可能已并发完成
+    status = part_info.get('status') or 0
+    if status < 2:  # 未下载时status只表示下载状态
+        return
+    progress = 4 if part_info.get('default_note') else 3 if part_info.get('subtitle') else 2
+    if progress > status:
+        await set_part_status(part_info, progress)
+
+async def run_download_stage(context: dict, results: dict):
+    part_info = await load_part(context)
+    if not await ensure_video(context['url'], context.get('cookie'), part_info):
+        raise RuntimeError("视频下载失败")
+    await sync_part_status(part_info)
+
+async def run_audio_stage(context: dict, results: dict):
+    """B站已有字幕时直接保存，不需要提取音频和识别；否则返回提取出的音频路径"""
+    part_info = await load_part(context)
+    if part_info.get('subtitle'):
+        return None
+    subtitle = await fetch_bilibili_subtitle(context['url'], context.get('cookie'))
+    if subtitle:
+        await save_subtitle(part_info, subtitle)
+        return None
+    return await extract_audio(context['url'], context.get('cookie'), part_info)
+
+async def run_asr_stage(context: dict, results: dict):
+    part_info = await load_part(context)
+
+    # 与ensure_subtitle共用同一个键，返回值也需一致：字幕数据，无法获取时为None
+    async def transcribe():
+        await reload_part_info(part_info)
+        if part_info.get('subtitle'):
+            return json.loads(part_info['subtitle'])
+        audio_path = results['audio']
+        if not audio_path or not os.path.exists(audio_path):  # 音频可能已被磁盘配额淘汰
+            audio_path = await extract_audio(context['url'], context.get('cookie'), part_info)
+        subtitle = await aget_subtitle_from_ai(audio_path)
+        await trim_video_cache(keep=[(context['bv'], context['page'])])
+        if not subtitle:
+            return None
+        await save_subtitle(part_info, subtitle)
+        return subtitle
+
+    if not await single_flight.run((part_info['part_id'], 'subtitle'), transcribe):
+        raise RuntimeError("无法获取字幕")
+    await sync_part_status(part_info)
+
+async def run_notes_stage(context: dict, results: dict):
+    part_info = await load_part(context)
+    await ensure_notes(part_info, json.loads(part_info['subtitle']))
+    await sync_part_status(part_info)
+
+async def run_quiz_stage(context: dict, results: dict):
+    part_info = await load_part(context)
+    await ensure_quiz(part_info, json.loads(part_info['subtitle']))
+
+# 分P的处理流水线：download与字幕链路相互独立，audio -> asr -> (notes, quiz)；
+# 各阶段状态保存在tmp/pipeline，重启后继续，已完成的阶段不会重做
+pipeline = Orchestrator(get_file_path("tmp/pipeline"), [
+    Stage("download", run_download_stage, concurrency=PIPELINE_DOWNLOAD_CONCURRENCY, retries=PIPELINE_RETRIES, recheck=True),
+    Stage("audio", run_audio_stage, concurrency=PIPELINE_AUDIO_CONCURRENCY, retries=PIPELINE_RETRIES),
+    Stage("asr", run_asr_stage, deps=["audio"], concurrency=PIPELINE_ASR_CONCURRENCY, retries=PIPELINE_RETRIES),
+    Stage("notes", run_notes_stage, deps=["asr"], concurrency=PIPELINE_NOTES_CONCURRENCY, retries=PIPELINE_RETRIES),
+    Stage("quiz", run_quiz_stage, deps=["asr"], concurrency=PIPELINE_QUIZ_CONCURRENCY, retries=PIPELINE_RETRIES),
+], lock_dir=get_file_path("bilibili_video/.locks"))
+
+def submit_part_job(bv_number: str, page: int, part_id: str, targets: list, cookie: str = None) -> dict:
+    """把分P交给流水线执行到targets为止；用户cookie只保存在内存中，重启恢复后使用默认cookie"""
+    return pipeline.submit(
+        part_id,
+        targets,
+        context={
+            'part_id': part_id,
+            'bv': bv_number,
+            'page': page,
+            'url': f"https://www.bilibili.com/video/{bv_number}?p={page}"
+        },
+        runtime={'cookie': cookie} if cookie else None
+    )
+
+def schedule_prefetch(bv_number: str, page: int, part_info: dict, cookie: str, targets: list) -> bool:
+    """后台预生成分P的产物；本进程流水线中的任务已达PREFETCH_QUEUE_SIZE时放弃并返回False"""
+    if part_info['part_id'] not in pipeline.active and len(pipeline.active) >= PREFETCH_QUEUE_SIZE:
+        print(f"流水线任务过多，跳过预生成: {bv_number} P{page}")
+        return False
+    submit_part_job(bv_number, page, part_info['part_id'], targets, cookie)
+    return True
+
 @app.get("/")
 async def hello():
     return {
@@ -84,71 +383,79 @@ async def get_video(request: URLRequest):
     try:
         if request.url.startswith('https://www.bilibili.com/video/'):
             bv_number, p_number = extract_bv_and_p_from_url(request.url)
-            file_suffix = f"_p{p_number}" if p_number > 1 else ""
-            video_path = get_file_path(f"bilibili_video/{bv_number}{file_suffix}.mp4")
-            meta_data = get_video_info(bv_number)
-            series_id = await ensure_bilibili_video_exists(bv_number, meta_data)
+            series_id = await get_series_id(bv_number)
             part_info = await get_part_info(series_id, p_number)
             if not part_info:
                 raise HTTPException(status_code=404, detail="未找到对应的分P信息")
-            if part_info['status'] == 2 and os.path.exists(video_path):  # 已下载
-                print(f"视频已存在，直接返回: {video_path}")
-                return FileResponse(video_path, media_type='video/mp4')
-            update_course_part(part_info['part_id'], {'status': 1})
-            print(f"视频不存在或未下载完成，开始下载: {request.url}")
-            if download_video(request.url, request.cookie):
-                update_course_part(part_info['part_id'], {'status': 2})
-                return FileResponse(video_path, media_type='video/mp4')
-            update_course_part(part_info['part_id'], {'status': 0})
+            if request.prefetch if request.prefetch is not None else VIDEO_PREFETCH:
+                # 用户看视频时通常很快会打开笔记和题目，提前在后台生成；下一分P先准备好字幕
+                schedule_prefetch(bv_number, p_number, part_info, request.cookie, ["notes", "quiz"])
+                next_part = await get_part_info(series_id, p_number + 1)
+                if next_part:
+                    schedule_prefetch(bv_number, p_number + 1, next_part, request.cookie, ["asr"])
+            download = run_in_background(ensure_video(request.url, request.cookie, part_info))
+            if VIDEO_PROGRESSIVE:
+                # 下载开始（已探测到大小并预分配.part文件）后立即边下边播，不必等整个文件下载完成
+                video_path = get_video_path(bv_number, p_number)
+                video_key = (part_info['part_id'], 'video')
+                while not download.done():
+                    if get_download_state(video_path):
+                        return GrowingFileResponse(
+                            video_path,
+                            alive=lambda: not download.done() or single_flight.is_locked(video_key),
+                            media_type='video/mp4'
+                        )
+                    await asyncio.wait([download], timeout=0.2)
+            video_path = await download
+            if video_path:
+                video_cache.touch(video_path)
+                return RangeFileResponse(video_path, media_type='video/mp4')
             raise HTTPException(status_code=500, detail="视频下载失败")
+    except HTTPException:
+        raise
     except Exception as e:
-        if 'part_info' in locals() and part_info:
-            update_course_part(part_info['part_id'], {'status': 0})
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/video/{bv_number}")
+async def play_video(bv_number: str, p: int = 1):
+    """
+    直接播放已下载的视频，可作为<video>的src使用
+
+    浏览器拖动进度条时发出的Range请求由RangeFileResponse处理；正在下载的分P边下边播，
+    未下载或下载已中断的分P请先调用 POST /video
+    """
+    if not re.fullmatch(r'BV\w{10}', bv_number):
+        raise HTTPException(status_code=404, detail="无效的BV号")
+    video_path = get_video_path(bv_number, p)
+    if not os.path.exists(video_path):
+        if VIDEO_PROGRESSIVE and get_download_state(video_path):
+            # 断点记录可能是失败或进程退出后残留的，只有持有下载锁的下载器在运行时才边下边播
+            series = await run_in_threadpool(get_course_series, unique_id=bv_number)
+            part_info = await get_part_info(series[0]['series_id'], p) if series else None
+            if part_info:
+                video_key = (part_info['part_id'], 'video')
+                if single_flight.is_locked(video_key):
+                    return GrowingFileResponse(
+                        video_path,
+                        alive=lambda: single_flight.is_locked(video_key),
+                        media_type='video/mp4'
+                    )
+        raise HTTPException(status_code=404, detail="视频尚未下载")
+    video_cache.touch(video_path)
+    return RangeFileResponse(video_path, media_type='video/mp4')
+
 @app.post("/subtitle")
 async def get_subtitle(request: URLRequest):
     try:
         bv_number, p_number = extract_bv_and_p_from_url(request.url)
-        file_suffix = f"_p{p_number}" if p_number > 1 else ""
-        series = get_course_series(unique_id=bv_number)
-        if not series:
-            meta_data = get_video_info(bv_number)
-            series_id = await ensure_bilibili_video_exists(bv_number, meta_data)
-        else:
-            series_id = series[0]['series_id']
-            
+        series_id = await get_series_id(bv_number)
         part_info = await get_part_info(series_id, p_number)
         if not part_info:
             raise HTTPException(status_code=404, detail="未找到对应的分P信息")
-            
-        # 检查数据库中是否已有字幕
-        if part_info.get('subtitle'):
-            return json.loads(part_info['subtitle'])
-            
-        # 获取字幕
-        meta_data = get_video_info(bv_number)
-        cid, aid = get_video_cid_aid(meta_data, p_number)
-        subtitle = get_subtitle_from_bilibili(aid, cid, request.cookie)
-        
-        if not subtitle:
-            video_path = get_file_path(f"bilibili_video/{bv_number}{file_suffix}.mp4")
-            if not os.path.exists(video_path):
-                if not download_video(request.url, request.cookie):
-                    raise HTTPException(status_code=500, detail="视频下载失败")
-            audio_path = video2audio(video_path)
-            subtitle = get_subtitle_from_ai(audio_path)
-            
+        subtitle = await ensure_subtitle(request.url, request.cookie, part_info)
         if not subtitle:
             raise HTTPException(status_code=404, detail="无法获取字幕")
-            
-        # 更新数据库中的字幕信息
-        update_course_part(part_info['part_id'], {
-            'subtitle': json.dumps(subtitle, ensure_ascii=False)  # 直接存储整个字幕数据
-        })
-        
         return subtitle  # 直接返回字幕数据
-        
     except HTTPException:
         raise
     except Exception as e:
@@ -158,24 +465,18 @@ async def get_subtitle(request: URLRequest):
 async def get_quiz(request: URLRequest):
     try:
         bv_number, p_number = extract_bv_and_p_from_url(request.url)
-        series = get_course_series(unique_id=bv_number)
-        if not series:
-            meta_data = get_video_info(bv_number)
-            series_id = await ensure_bilibili_video_exists(bv_number, meta_data)
-        else:
-            series_id = series[0]['series_id']
-
+        series_id = await get_series_id(bv_number)
         part_info = await get_part_info(series_id, p_number)
         if not part_info:
             raise HTTPException(status_code=404, detail="未找到对应的分P信息")
-
+        quizzes = await run_in_threadpool(get_quizzes, part_id=part_info['part_id'])
+        if quizzes:
+            return {"quizzes": quizzes[0]['question_text']}
         # 确保有字幕
-        if not part_info.get('subtitle'):
-            await get_subtitle(request)
-            part_info = await get_part_info(series_id, p_number)
-
-        subtitle_data = json.loads(part_info['subtitle'])
-        quizzes = get_ai_quiz(subtitle_data)
+        subtitle_data = await ensure_subtitle(request.url, request.cookie, part_info)
+        if not subtitle_data:
+            raise HTTPException(status_code=404, detail="无法获取字幕")
+        quizzes = await ensure_quiz(part_info, subtitle_data)
         return {"quizzes": quizzes}
     except HTTPException:
         raise
@@ -186,31 +487,66 @@ async def get_quiz(request: URLRequest):
 async def get_notes(request: URLRequest):
     try:
         bv_number, p_number = extract_bv_and_p_from_url(request.url)
-        series = get_course_series(unique_id=bv_number)
-        if not series:
-            meta_data = get_video_info(bv_number)
-            series_id = await ensure_bilibili_video_exists(bv_number, meta_data)
-        else:
-            series_id = series[0]['series_id']
+        series_id = await get_series_id(bv_number)
         part_info = await get_part_info(series_id, p_number)
         if not part_info:
             raise HTTPException(status_code=404, detail="未找到对应的分P信息")
         if part_info.get('default_note'):
             return {"notes": part_info['default_note']}
-        if not part_info.get('subtitle'):
-            await get_subtitle(request)
-            part_info = await get_part_info(series_id, p_number)
-        subtitle_data = json.loads(part_info['subtitle'])
-        notes = get_ai_notes(subtitle_data)
-        update_course_part(part_info['part_id'], {
-            'default_note': notes
-        })
+        subtitle_data = await ensure_subtitle(request.url, request.cookie, part_info)
+        if not subtitle_data:
+            raise HTTPException(status_code=404, detail="无法获取字幕")
+        notes = await ensure_notes(part_info, subtitle_data)
         return {"notes": notes}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ingest")
+async def ingest_series(request: URLRequest):
+    """
+    后台预处理整个系列：每个分P经流水线下载视频、生成字幕、笔记和题目
+
+    立即返回，进度通过course_parts.status和 GET /ingest/{bv_number} 查询；重复提交会重试失败的阶段
+    """
+    try:
+        bv_number, _ = extract_bv_and_p_from_url(request.url)
+        meta_data = await aget_video_info(bv_number)
+        if not meta_data:
+            raise HTTPException(status_code=404, detail="无法获取视频信息")
+        series_id = await ensure_bilibili_video_exists(bv_number, meta_data)
+        parts = await run_in_threadpool(get_course_parts, series_id=series_id)
+        for part in parts:
+            submit_part_job(bv_number, part['page'], part['part_id'], ["download", "notes", "quiz"], request.cookie)
+        return {"status": "accepted", "bv": bv_number, "series_id": series_id, "parts": len(parts)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/ingest/{bv_number}")
+async def get_ingest_progress(bv_number: str):
+    series = await run_in_threadpool(get_course_series, unique_id=bv_number)
+    if not series:
+        raise HTTPException(status_code=404, detail="未找到对应的课程系列")
+    parts = await run_in_threadpool(get_course_parts, series_id=series[0]['series_id'])
+    progress = []
+    for part in sorted(parts, key=lambda part: part['page']):
+        job = pipeline.get(part['part_id']) or {'status': None, 'stages': {}}
+        progress.append({
+            "page": part['page'],
+            "title": part['title'],
+            "status": part['status'],
+            "pipeline": job['status'],
+            "stages": {name: state['status'] for name, state in job['stages'].items()},
+            "errors": {name: state['error'] for name, state in job['stages'].items() if state['status'] == "failed"}
+        })
+    return {
+        "running": any(part['pipeline'] == "running" for part in progress),
+        "parts": progress
+    }
+
 if __name__ == '__main__':
     # 确保必要的文件夹存在
     if not os.path.exists(get_file_path("bilibili_video")):
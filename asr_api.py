@@ -1,27 +1,117 @@
-import os, re
-from fastapi import FastAPI, UploadFile
-from fastapi.responses import HTMLResponse
+import os, re, subprocess, json, queue, asyncio, multiprocessing, threading, math
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import FastAPI, UploadFile, Depends, HTTPException, Request
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from funasr.utils.postprocess_utils import rich_transcription_postprocess
 from pathlib import Path
 from datetime import timedelta
 from funasr import AutoModel
 import torch
-import shutil
-from pydub import AudioSegment
-from settings import ASR_HOST, ASR_PORT
+import numpy as np
+from settings import (
+    ASR_HOST, ASR_PORT, ASR_BATCH_SIZE, ASR_JOB_WORKERS, ASR_JOB_QUEUE_SIZE,
+    ASR_WORKERS, ASR_THREADS_PER_WORKER, ASR_CACHE_SIZE_MB,
+    ASR_SCHEDULER, ASR_MAX_BATCH_SIZE, ASR_MAX_WAIT_MS,
+    ASR_WINDOW_SECONDS, ASR_WINDOW_OVERLAP_SECONDS,
+    ASR_MERGE_TARGET_MS, ASR_MERGE_MAX_GAP_MS, ASR_SPLIT_MAX_MS
+)
+from components.asrJobs import ASRJobManager
+from components.asrCache import ASRCache, hash_bytes
+from components.asrScheduler import MicroBatchScheduler
 
 TMPDIR=Path(os.path.dirname(__file__)+"/tmp").as_posix()
 Path(TMPDIR).mkdir(exist_ok=True)
 device="cuda:0" if torch.cuda.is_available() else "cpu"
+SAMPLE_RATE = 16000
+# 窗口边界处被裁剪后短于此值的片段直接丢弃
+MIN_SEGMENT_MS = 200
 
 # asr_model_path = "./SenseVoiceSmall"
 # seg_model_path = "./punc_ct-transformer_cn-en-common-vocab471067-large"
 asr_model_path = "iic/SenseVoiceSmall"
 seg_model_path = "fsmn-vad"
+VAD_PARAMS = {"max_single_segment_time": 20000, "max_end_silence_time": 250}
 
-model = AutoModel(model=asr_model_path, punc_model="ct-punc", disable_update=True, device=device,disable_log=True,disable_pbar=True)
-vm = AutoModel(model=seg_model_path,max_single_segment_time=20000,max_end_silence_time=250,disable_update=True,device=device,disable_log=True,disable_pbar=True)
-app = FastAPI()
+# 模型在load_models中加载：单进程模式下由主进程加载，进程池模式下由每个工作进程各自加载
+model = None
+vm = None
+# 进程池模式下的工作进程池，以及用于从工作进程回传流式结果的Manager
+pool = None
+manager = None
+jobs = None
+cache = None
+# 跨请求动态批处理调度器，仅在单进程模式下启用
+scheduler = None
+# funasr的AutoModel在推理时修改共享状态（VAD的cache默认参数、self.kwargs），不能被多个线程同时调用；
+# 单进程模式下请求在线程池、任务线程和/asr/windowed的线程中识别，需串行使用同一模型
+vad_lock = threading.Lock()
+asr_lock = threading.Lock()
+
+def load_models(num_threads=None):
+    """加载ASR和VAD模型，num_threads为torch的intra-op线程数"""
+    global model, vm
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = AutoModel(model=asr_model_path, punc_model="ct-punc", disable_update=True, device=device,disable_log=True,disable_pbar=True)
+    vm = AutoModel(model=seg_model_path,**VAD_PARAMS,disable_update=True,device=device,disable_log=True,disable_pbar=True)
+
+def create_worker_pool(workers, threads_per_worker=0):
+    """
+    创建ASR工作进程池，每个进程各自加载一份模型
+
+    使用spawn启动，避免fork后torch线程池死锁；threads_per_worker为0时按CPU核数均分
+    """
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=load_models,
+        initargs=(threads,)
+    )
+
+@asynccontextmanager
+async def lifespan(app):
+    global pool, manager, jobs, cache, scheduler
+    if ASR_WORKERS > 0:
+        pool = create_worker_pool(ASR_WORKERS, ASR_THREADS_PER_WORKER)
+        manager = multiprocessing.get_context("spawn").Manager()
+    else:
+        load_models()
+        if ASR_SCHEDULER:
+            scheduler = MicroBatchScheduler(
+                lambda inputs: transcribe_segments(inputs, [len(x) for x in inputs], batch_size=len(inputs)),
+                max_batch_size=ASR_MAX_BATCH_SIZE,
+                max_wait_ms=ASR_MAX_WAIT_MS
+            )
+    cache = ASRCache(
+        f"{TMPDIR}/cache",
+        ASR_CACHE_SIZE_MB * 1024 * 1024,
+        {"asr_model": asr_model_path, "vad_model": seg_model_path, **VAD_PARAMS}
+    )
+    jobs = ASRJobManager(f"{TMPDIR}/jobs", run_asr_job, workers=ASR_JOB_WORKERS, queue_size=ASR_JOB_QUEUE_SIZE)
+    yield
+    if pool:
+        pool.shutdown(cancel_futures=True)
+        manager.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+class ASROptions(BaseModel):
+    # 每批送入模型的片段数，1 即逐段识别
+    batch_size: int = Field(ASR_BATCH_SIZE, ge=1)
+    # 相邻VAD片段合并后的目标时长（毫秒），0 表示不合并
+    merge_target_ms: int = Field(ASR_MERGE_TARGET_MS, ge=0)
+    # 只合并间隔不超过该值（毫秒）的相邻片段
+    merge_max_gap_ms: int = Field(ASR_MERGE_MAX_GAP_MS, ge=0)
+    # 超过该时长（毫秒）的片段均分拆开，0 表示不拆分
+    split_max_ms: int = Field(ASR_SPLIT_MAX_MS, ge=0)
+
+    def cache_options(self):
+        """影响识别结果的参数，作为缓存键的一部分；batch_size只影响速度"""
+        return self.model_dump(exclude={"batch_size"})
 
 def ms_to_time_string(*, ms=0, seconds=None):
     # 计算小时、分钟、秒和毫秒
@@ -64,6 +154,285 @@ def remove_unwanted_characters(text: str) -> str:
                                     r'a-zA-Z0-9\s.,!@#$%^&*()_+\-=\[\]{};\'"\\|<>/?，。！｛｝【】；‘’“”《》、（）￥]+')
     return re.sub(allowed_characters, '', text)
 
+def transcribe_segments(inputs, durations, batch_size=ASR_BATCH_SIZE):
+    """
+    批量识别音频片段
+
+    按时长排序后分批送入模型以减少padding，返回的文本顺序与inputs一致
+
+    Args:
+        inputs (list): 音频片段的采样数组
+        durations (list): 每个片段的时长，仅用于排序
+        batch_size (int): 每批片段数
+
+    Returns:
+        list: 每个片段的识别文本
+    """
+    texts = [""] * len(inputs)
+    order = sorted(range(len(inputs)), key=lambda i: durations[i])
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        with asr_lock:
+            res = model.generate(
+                input=[inputs[i] for i in batch],
+                language="auto",
+                use_itn=True,
+                batch_size=len(batch)
+            )
+        for i, item in zip(batch, res):
+            texts[i] = remove_unwanted_characters(rich_transcription_postprocess(item["text"])).strip()
+    return texts
+
+def decode_segments(inputs, durations, batch_size=ASR_BATCH_SIZE):
+    """
+    识别一组片段；启用调度器时与其他请求的片段合批，否则在本请求内分批
+
+    两种方式返回的文本顺序都与inputs一致
+    """
+    if scheduler:
+        return scheduler.map(inputs, order=sorted(range(len(inputs)), key=lambda i: durations[i]))
+    return transcribe_segments(inputs, durations, batch_size=batch_size)
+
+def decode_cmd(sr=SAMPLE_RATE):
+    """从标准输入读取任意音频、向标准输出写单声道float32 PCM的ffmpeg命令"""
+    return ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-ar", str(sr), "pipe:1"]
+
+def load_audio(data: bytes, sr=SAMPLE_RATE) -> np.ndarray:
+    """用ffmpeg将上传的音频一次性解码为单声道float32采样"""
+    out = subprocess.run(decode_cmd(sr), input=data, capture_output=True, check=True).stdout
+    # bytearray使数组可写，torch.from_numpy不会告警
+    return np.frombuffer(bytearray(out), dtype=np.float32)
+
+def slice_audio(audio, seg, sr=SAMPLE_RATE):
+    """按毫秒区间取音频片段，返回的是原数组的视图而非拷贝"""
+    return audio[seg[0] * sr // 1000:seg[1] * sr // 1000]
+
+def merge_segments(segments, target_ms=0, max_gap_ms=0, split_max_ms=0):
+    """
+    合并相邻的短片段并拆分过长的片段
+
+    相邻片段间隔不超过max_gap_ms、且合并后总时长不超过target_ms时合并；
+    时长超过split_max_ms的片段均分为若干段
+
+    Args:
+        segments (list): VAD输出的[start, end]毫秒区间列表
+        target_ms (int): 合并后的目标时长，0 表示不合并
+        max_gap_ms (int): 允许合并的最大间隔
+        split_max_ms (int): 单个片段的最大时长，0 表示不拆分
+
+    Returns:
+        list: 处理后的[start, end]列表
+    """
+    merged = []
+    for start, end in segments:
+        if (target_ms and merged and start - merged[-1][1] <= max_gap_ms
+                and end - merged[-1][0] <= target_ms):
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    if not split_max_ms:
+        return merged
+    result = []
+    for start, end in merged:
+        parts = math.ceil((end - start) / split_max_ms)
+        if parts <= 1:
+            result.append([start, end])
+            continue
+        step = (end - start) / parts
+        result.extend([int(start + i * step), int(start + (i + 1) * step)] for i in range(parts))
+    return result
+
+def vad_segments(audio, options):
+    """VAD切分后按options合并/拆分，打印片段数的变化"""
+    with vad_lock:
+        raw = vm.generate(input=audio)[0]['value']
+    segments = merge_segments(raw, options.merge_target_ms, options.merge_max_gap_ms, options.split_max_ms)
+    print(f"VAD片段数: {len(raw)} -> {len(segments)}")
+    return segments, len(raw)
+
+def to_subtitle_segment(seg, text):
+    """将一个识别结果转换为字幕格式"""
+    return {
+        "from": seg[0] / 1000,  # 转换为秒
+        "to": seg[1] / 1000,    # 转换为秒
+        "location": 2,          # 固定底部位置
+        "content": text
+    }
+
+def transcribe_audio(audio, options):
+    """对整段音频做VAD切分和识别，返回(字幕片段列表, 片段数统计)"""
+    segments, vad_count = vad_segments(audio, options)
+    texts = decode_segments(
+        [slice_audio(audio, seg) for seg in segments],
+        [seg[1] - seg[0] for seg in segments],
+        batch_size=options.batch_size
+    )
+    stats = {"vad_segments": vad_count, "segments": len(segments)}
+    return [to_subtitle_segment(seg, text) for seg, text in zip(segments, texts)], stats
+
+def iter_transcribe_audio(audio, options):
+    """
+    按时间顺序逐批识别，每识别完一批就产出其中的字幕片段
+
+    与transcribe_audio不同，这里不按时长排序，保证片段按时间先后产出
+    """
+    segments, _ = vad_segments(audio, options)
+    for start in range(0, len(segments), options.batch_size):
+        batch = segments[start:start + options.batch_size]
+        texts = decode_segments(
+            [slice_audio(audio, seg) for seg in batch],
+            [seg[1] - seg[0] for seg in batch],
+            batch_size=options.batch_size
+        )
+        for seg, text in zip(batch, texts):
+            yield to_subtitle_segment(seg, text)
+
+def iter_pcm_windows(pcm, window_s=ASR_WINDOW_SECONDS, overlap_s=ASR_WINDOW_OVERLAP_SECONDS, sr=SAMPLE_RATE):
+    """
+    从float32 PCM管道中按窗口读取采样
+
+    每个窗口长window_s+overlap_s秒，相邻窗口重叠overlap_s秒，整个过程只复用一块缓冲区，
+    内存占用与音频总长度无关。产出(窗口起点的采样偏移, 窗口采样, 是否最后一个窗口)，
+    窗口采样在下一次迭代时会被覆盖。
+    """
+    window = int(window_s * sr)
+    overlap = int(overlap_s * sr)
+    buf = np.empty(window + overlap, dtype=np.float32)
+    view = memoryview(buf).cast('B')
+    filled = 0
+    offset = 0
+    while True:
+        while filled < buf.nbytes:
+            n = pcm.readinto(view[filled:])
+            if not n:
+                break
+            filled += n
+        last = filled < buf.nbytes
+        count = filled // 4
+        if count:
+            yield offset, buf[:count], last
+        if last:
+            return
+        # 把重叠部分移到缓冲区开头，接着读下一个窗口
+        buf[:overlap] = buf[window:]
+        filled = overlap * 4
+        offset += window
+
+def transcribe_window(window, options, min_start_ms=0, max_start_ms=None):
+    """
+    识别一个窗口，返回[(相对窗口起点的毫秒区间, 文本)]
+
+    起点不早于max_start_ms的片段留给下一个窗口；起点早于min_start_ms的部分已由上一个窗口识别，裁掉
+    """
+    with vad_lock:
+        raw = vm.generate(input=window)[0]['value']
+    segments = []
+    for start, end in raw:
+        if max_start_ms is not None and start >= max_start_ms:
+            continue
+        start = max(start, min_start_ms)
+        if end - start < MIN_SEGMENT_MS:
+            continue
+        segments.append([start, end])
+    segments = merge_segments(segments, options.merge_target_ms, options.merge_max_gap_ms, options.split_max_ms)
+    texts = decode_segments(
+        [slice_audio(window, seg) for seg in segments],
+        [seg[1] - seg[0] for seg in segments],
+        batch_size=options.batch_size
+    )
+    return list(zip(segments, texts))
+
+def iter_windowed_asr(pcm, options, window_s=ASR_WINDOW_SECONDS, overlap_s=ASR_WINDOW_OVERLAP_SECONDS):
+    """
+    逐窗口做VAD和识别，按时间顺序产出字幕片段
+
+    重叠部分应长于VAD的max_single_segment_time，这样跨越窗口边界的片段总能在
+    前一个窗口内完整识别，不会被切断
+    """
+    window_ms = int(window_s * 1000)
+    last_end = 0
+    for offset, samples, last in iter_pcm_windows(pcm, window_s, overlap_s):
+        offset_ms = offset * 1000 // SAMPLE_RATE
+        args = (options, max(last_end - offset_ms, 0), None if last else window_ms)
+        if pool:
+            results = pool.submit(transcribe_window, samples, *args).result()
+        else:
+            results = transcribe_window(samples, *args)
+        for (start, end), text in results:
+            last_end = end + offset_ms
+            yield to_subtitle_segment([start + offset_ms, end + offset_ms], text)
+
+def build_subtitle_data(subtitle_segments):
+    """构建最终的字幕数据"""
+    return [{
+        "lan": "AI生成",
+        "subtitle": subtitle_segments
+    }]
+
+def transcribe_bytes(data, options):
+    """解码并识别整个文件，返回(字幕片段列表, 片段数统计)，可直接提交到进程池"""
+    return transcribe_audio(load_audio(data), ASROptions(**options))
+
+def stream_bytes(data, options, out):
+    """在工作进程中逐批识别，先放入音频时长，再逐个放入字幕片段，最后放入None"""
+    try:
+        audio = load_audio(data)
+        out.put(len(audio) / SAMPLE_RATE)
+        for segment in iter_transcribe_audio(audio, ASROptions(**options)):
+            out.put(segment)
+    finally:
+        out.put(None)
+
+async def run_asr(data, options):
+    """在进程池或线程池中识别整个文件，不阻塞事件循环，返回(字幕片段列表, 片段数统计)"""
+    if pool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, transcribe_bytes, data, options.model_dump())
+    return await run_in_threadpool(transcribe_bytes, data, options.model_dump())
+
+def iter_asr(data, options, report=None):
+    """
+    逐个产出字幕片段，可选地通过report(progress)上报0~1的进度
+
+    进程池模式下识别在工作进程中进行，片段经Manager队列传回；这是阻塞迭代器，
+    应在线程中消费
+    """
+    if pool is None:
+        audio = load_audio(data)
+        duration = len(audio) / SAMPLE_RATE
+        segments = iter_transcribe_audio(audio, options)
+    else:
+        out = manager.Queue()
+        future = pool.submit(stream_bytes, data, options.model_dump(), out)
+        duration = out.get()
+        if duration is None:
+            # 解码失败，抛出工作进程中的异常
+            future.result()
+            return
+
+        def drain():
+            while (segment := out.get()) is not None:
+                yield segment
+            # 抛出工作进程中的异常
+            future.result()
+
+        segments = drain()
+    for segment in segments:
+        if report:
+            report(segment['to'] / max(duration, 1e-3))
+        yield segment
+
+def run_asr_job(data, options, report):
+    """异步任务的处理函数，按已识别到的时间位置上报进度，命中缓存时直接返回"""
+    options = ASROptions(**options)
+    audio_hash = hash_bytes(data)
+    subtitle_data = cache.get(audio_hash, options.cache_options())
+    if subtitle_data is None:
+        subtitle_data = build_subtitle_data(list(iter_asr(data, options, report)))
+        cache.put(audio_hash, options.cache_options(), subtitle_data)
+    return subtitle_data
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     return f"""
@@ -75,49 +444,144 @@ async def root():
         </head>
         <body>
             api 地址为 http://{ASR_HOST}:{ASR_PORT}/asr
+            <br>
+            流式接口为 http://{ASR_HOST}:{ASR_PORT}/asr/stream ，每行返回一个字幕片段（NDJSON）
+            <br>
+            超长音频接口为 http://{ASR_HOST}:{ASR_PORT}/asr/windowed ，请求体直接上传音频字节，按窗口解码识别
+            <br>
+            异步任务接口为 http://{ASR_HOST}:{ASR_PORT}/asr/jobs ，提交后轮询 /asr/jobs/{{job_id}} ，完成后从 /asr/jobs/{{job_id}}/result 获取结果
         </body>
     </html>
     """
 
+def stats_headers(subtitle_data, stats):
+    """
+    通过响应头报告合并前后的片段数
+
+    X-ASR-Segments总是返回；X-ASR-VAD-Segments只有/asr识别时才统计，
+    命中由流式接口或异步任务写入的缓存时没有该响应头
+    """
+    headers = {"X-ASR-Segments": str(len(subtitle_data[0]['subtitle']))}
+    if stats and "vad_segments" in stats:
+        headers["X-ASR-VAD-Segments"] = str(stats["vad_segments"])
+    return headers
+
 @app.post("/asr")
-async def asr(file: UploadFile):
-    # 创建一个临时文件路径
-    temp_file_path = f"{TMPDIR}/{file.filename}"
-    ## 将上传的文件保存到临时路径
-    with open(temp_file_path, "wb") as temp_file:
-        shutil.copyfileobj(file.file, temp_file)
-    segments = vm.generate(input=temp_file_path)
-    audiodata = AudioSegment.from_file(temp_file_path)    
-    
-    # 存储所有字幕片段
-    subtitle_segments = []
-    
-    for seg in segments[0]['value']:
-        chunk = audiodata[seg[0]:seg[1]]
-        filename = f"{TMPDIR}/{seg[0]}-{seg[1]}.wav"
-        chunk.export(filename)
-        res = model.generate(
-            input=filename,
-            language="auto",
-            use_itn=True
-        )
-        text = remove_unwanted_characters(rich_transcription_postprocess(res[0]["text"]))
-        # 将每个片段转换为字幕格式
-        subtitle_segments.append({
-            "from": seg[0] / 1000,  # 转换为秒
-            "to": seg[1] / 1000,    # 转换为秒
-            "location": 2,          # 固定底部位置
-            "content": text.strip()
-        })
-    
-    # 构建最终的字幕数据
-    subtitle_data = [{
-        "lan": "AI生成",
-        "subtitle": subtitle_segments
-    }]
-    
+async def asr(file: UploadFile, options: ASROptions = Depends()):
+    data = await file.read()
+    audio_hash = await run_in_threadpool(hash_bytes, data)
+    # 缓存读写和淘汰都是磁盘操作，放到线程池中避免阻塞事件循环
+    subtitle_data, stats = await run_in_threadpool(cache.get, audio_hash, options.cache_options(), True)
+    if subtitle_data is None:
+        # 整个文件只解码一次，VAD和ASR都直接使用内存中的采样
+        subtitle_segments, stats = await run_asr(data, options)
+        subtitle_data = build_subtitle_data(subtitle_segments)
+        await run_in_threadpool(cache.put, audio_hash, options.cache_options(), subtitle_data, stats)
+    return JSONResponse(subtitle_data, headers=stats_headers(subtitle_data, stats))
+
+@app.post("/asr/stream")
+async def asr_stream(file: UploadFile, options: ASROptions = Depends()):
+    """每识别完一个片段就以一行JSON返回 {from, to, location, content}"""
+    data = await file.read()
+    audio_hash = await run_in_threadpool(hash_bytes, data)
+    # 缓存读写和淘汰都是磁盘操作，放到线程池中避免阻塞事件循环
+    subtitle_data = await run_in_threadpool(cache.get, audio_hash, options.cache_options())
+
+    def ndjson():
+        if subtitle_data is not None:
+            for segment in subtitle_data[0]['subtitle']:
+                yield json.dumps(segment, ensure_ascii=False) + "\n"
+            return
+        subtitle_segments = []
+        for segment in iter_asr(data, options):
+            subtitle_segments.append(segment)
+            yield json.dumps(segment, ensure_ascii=False) + "\n"
+        cache.put(audio_hash, options.cache_options(), build_subtitle_data(subtitle_segments))
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/asr/windowed")
+async def asr_windowed(request: Request, options: ASROptions = Depends()):
+    """
+    超长音频的识别：请求体直接是音频字节（不使用multipart），边接收边由ffmpeg解码，
+    按窗口做VAD和识别，峰值内存与音频长度无关。返回格式与/asr/stream相同。
+    """
+    proc = subprocess.Popen(decode_cmd(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    out = queue.Queue()
+
+    def produce():
+        try:
+            for segment in iter_windowed_asr(proc.stdout, options):
+                out.put(segment)
+            proc.stdout.close()
+            # 无法解码或被截断的音频会让ffmpeg提前退出，此时已产出的片段不完整，与/asr一样报错
+            if proc.wait() != 0:
+                raise RuntimeError(f"ffmpeg解码失败，返回码{proc.returncode}")
+        except Exception as e:
+            out.put(e)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            out.put(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+    # 请求体边读边写入ffmpeg；识别跟不上时管道写满，读取请求体也会随之暂停
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(proc.stdin.write, chunk)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def ndjson():
+        while (item := out.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/asr/cache/{audio_hash}")
+async def lookup_asr_cache(audio_hash: str, options: ASROptions = Depends()):
+    """按音频的SHA-256查询已有的识别结果，客户端命中时可跳过上传"""
+    subtitle_data = await run_in_threadpool(cache.get, audio_hash, options.cache_options())
+    if subtitle_data is None:
+        raise HTTPException(status_code=404, detail="缓存未命中")
     return subtitle_data
 
+@app.post("/asr/jobs")
+async def submit_asr_job(file: UploadFile, options: ASROptions = Depends()):
+    """提交异步识别任务，立即返回job_id"""
+    try:
+        # 写入音频可能有数百MB，放到线程池中避免阻塞事件循环
+        return await run_in_threadpool(jobs.submit, await file.read(), options.model_dump())
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="ASR任务队列已满，请稍后重试")
+
+@app.get("/asr/jobs/{job_id}")
+async def get_asr_job(job_id: str):
+    """查询任务状态和进度"""
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.get("/asr/jobs/{job_id}/result")
+async def get_asr_job_result(job_id: str):
+    """获取已完成任务的识别结果"""
+    job = jobs.result(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job['status'] == "failed":
+        raise HTTPException(status_code=500, detail=job['error'])
+    if job['status'] != "done":
+        raise HTTPException(status_code=409, detail="任务尚未完成")
+    return job['result']
+
 
 if __name__=='__main__':
     import uvicorn
@@ -0,0 +1,219 @@
+"""
+ASR离线性能测试
+
+生成（或读取）不同时长的音频，分别以逐段、批量、进程池、跨请求调度几种方式跑完整的VAD+ASR流程，
+统计实时率（RTF）、每秒识别片段数、请求延迟的p50/p95和峰值内存，结果写入JSON以便对比历次运行。
+
+用法：
+    python bench_asr.py --lengths 60 600 --modes sequential batched pooled --output bench_asr.json
+    python bench_asr.py --baseline bench_asr.json   # 与上次结果对比，RTF变差超过阈值时返回非0
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import asr_api
+from asr_api import SAMPLE_RATE, ASROptions
+from components.asrScheduler import MicroBatchScheduler
+from settings import ASR_BATCH_SIZE, ASR_MAX_BATCH_SIZE, ASR_MAX_WAIT_MS
+
+MODES = ["sequential", "batched", "pooled", "scheduled"]
+
+
+def synth_speech(seconds, sr=SAMPLE_RATE, seed=0):
+    """生成近似语音的合成音频：按音节节奏调制的谐波加少量噪声，中间夹杂0.3~1.5秒的静音"""
+    rng = np.random.default_rng(seed)
+    chunks = []
+    total = 0
+    while total < seconds * sr:
+        t = np.arange(int(rng.uniform(1.5, 8.0) * sr)) / sr
+        f0 = rng.uniform(100, 220)
+        voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        envelope = 0.5 * (1 - np.cos(2 * np.pi * 4 * t))
+        chunks.append(0.3 * voice * envelope + 0.02 * rng.standard_normal(len(t)))
+        chunks.append(np.zeros(int(rng.uniform(0.3, 1.5) * sr)))
+        total += len(chunks[-2]) + len(chunks[-1])
+    return np.concatenate(chunks)[:int(seconds * sr)].astype(np.float32)
+
+
+def to_wav_bytes(audio, sr=SAMPLE_RATE):
+    """将float32采样编码为16位WAV字节，模拟上传的文件"""
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+def percentile(values, p):
+    """最近秩法求百分位数"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p * len(ordered)) - 1, 0)]
+
+
+def reset_peak_rss(pid="self"):
+    """重置进程的峰值内存统计（Linux 4.0+），不支持时忽略"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb(pid="self"):
+    """读取进程的峰值内存（MB），优先使用/proc中可重置的VmHWM"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == "self":
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return 0.0
+
+
+def pool_pids():
+    return list(asr_api.pool._processes) if asr_api.pool else []
+
+
+def run_mode(mode, data, seconds, args):
+    """以指定方式运行repeat轮，每轮并发concurrency个请求，返回统计结果"""
+    options = ASROptions(batch_size=1 if mode == "sequential" else args.batch_size).model_dump()
+
+    def request():
+        start = time.perf_counter()
+        if mode == "pooled":
+            _, stats = asr_api.pool.submit(asr_api.transcribe_bytes, data, options).result()
+        else:
+            _, stats = asr_api.transcribe_bytes(data, options)
+        return time.perf_counter() - start, stats["segments"]
+
+    # 预热一轮，不计入统计（进程池模式下会触发工作进程加载模型）
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(lambda _: request(), range(args.concurrency)))
+
+    for pid in ["self"] + pool_pids():
+        reset_peak_rss(pid)
+    latencies = []
+    segments = 0
+    wall = 0.0
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            for latency, count in executor.map(lambda _: request(), range(args.concurrency)):
+                latencies.append(latency)
+                segments += count
+        wall += time.perf_counter() - start
+    audio_total = seconds * args.repeat * args.concurrency
+    return {
+        "mode": mode,
+        "audio_seconds": seconds,
+        "repeat": args.repeat,
+        "concurrency": args.concurrency,
+        "rtf": round(wall / audio_total, 5),
+        "segments_per_sec": round(segments / wall, 3),
+        "latency_p50": round(percentile(latencies, 0.5), 4),
+        "latency_p95": round(percentile(latencies, 0.95), 4),
+        "peak_rss_mb": round(sum(peak_rss_mb(pid) for pid in ["self"] + pool_pids()), 1)
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """与基线结果对比RTF，返回是否存在超过阈值的退化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r["mode"], r["audio_seconds"]): r for r in json.load(f)["results"]}
+    regressed = False
+    for r in results:
+        old = baseline.get((r["mode"], r["audio_seconds"]))
+        if not old:
+            continue
+        ratio = r["rtf"] / old["rtf"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- 退化"
+            regressed = True
+        print(f"{r['mode']:>10} {r['audio_seconds']:>6}s  RTF {old['rtf']:.4f} -> {r['rtf']:.4f} ({ratio:.2f}x){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASR离线性能测试")
+    parser.add_argument("--lengths", type=float, nargs="+", default=[30, 300, 1800], help="合成音频的时长（秒）")
+    parser.add_argument("--audio", nargs="+", default=[], help="使用已有的音频文件代替合成音频")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--batch-size", type=int, default=ASR_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4), help="pooled模式的工作进程数")
+    parser.add_argument("--concurrency", type=int, default=1, help="每轮同时发起的请求数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_asr.json")
+    parser.add_argument("--baseline", help="用于对比的历史结果JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="RTF变差超过该比例视为退化")
+    args = parser.parse_args()
+
+    inputs = []
+    for path in args.audio:
+        with open(path, 'rb') as f:
+            data = f.read()
+        inputs.append((data, len(asr_api.load_audio(data)) / SAMPLE_RATE))
+    for seconds in args.lengths:
+        inputs.append((to_wav_bytes(synth_speech(seconds)), seconds))
+
+    if set(args.modes) - {"pooled"}:
+        asr_api.load_models()
+    results = []
+    for mode in args.modes:
+        if mode == "pooled":
+            asr_api.pool = asr_api.create_worker_pool(args.workers)
+        if mode == "scheduled":
+            asr_api.scheduler = MicroBatchScheduler(
+                lambda xs: asr_api.transcribe_segments(xs, [len(x) for x in xs], batch_size=len(xs)),
+                max_batch_size=ASR_MAX_BATCH_SIZE,
+                max_wait_ms=ASR_MAX_WAIT_MS
+            )
+        try:
+            for data, seconds in inputs:
+                result = run_mode(mode, data, seconds, args)
+                print(json.dumps(result, ensure_ascii=False))
+                results.append(result)
+        finally:
+            if asr_api.pool:
+                asr_api.pool.shutdown()
+            asr_api.pool = None
+            asr_api.scheduler = None
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "device": asr_api.device,
+            "batch_size": args.batch_size,
+            "workers": args.workers
+        },
+        "results": results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,12 @@
-from fastapi import FastAPI, HTTPException, Header
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
 import os
 
 from settings import ALGO_PORT, ALGO_HOST
 from src.processVideo import download_video, extract_bv_and_p_from_url, get_video_info, get_video_cid_aid, video2audio
 from src.getSubtitle import get_subtitle_from_bilibili, get_subtitle_from_ai
+from components.rangeResponse import RangeFileResponse
 import json
 
 # 定义请求模型
@@ -34,7 +33,7 @@ async def hello():
     }
 
 @app.post("/bili")
-async def handle_bili(request: URLRequest, range: Optional[str] = Header(None)):
+async def handle_bili(request: URLRequest):
     try:
         url = request.url
         cookie = request.cookie
@@ -48,59 +47,8 @@ async def handle_bili(request: URLRequest, range: Optional[str] = Header(None)):
             if not download_video(url, cookie):
                 raise HTTPException(status_code=500, detail="视频下载失败")
 
-        file_size = os.path.getsize(video_path)
-
-        # 处理范围请求
-        if range:
-            try:
-                start_str = range.replace("bytes=", "").split("-")[0]
-                start = int(start_str)
-                # 每次返回1MB数据
-                chunk_size = 1024 * 1024
-                end = min(start + chunk_size, file_size - 1)
-            except ValueError:
-                start = 0
-                end = file_size - 1
-
-            # 构建响应头
-            headers = {
-                'Content-Range': f'bytes {start}-{end}/{file_size}',
-                'Accept-Ranges': 'bytes',
-                'Content-Length': str(end - start + 1),
-                'Content-Type': 'video/mp4',
-            }
-
-            # 返回指定范围的视频数据
-            async def range_stream():
-                with open(video_path, mode="rb") as video:
-                    video.seek(start)
-                    chunk = video.read(end - start + 1)
-                    yield chunk
-
-            return StreamingResponse(
-                range_stream(),
-                status_code=206,
-                headers=headers,
-                media_type="video/mp4"
-            )
-
-        # 如果没有范围请求，返回完整视频
-        async def normal_stream():
-            with open(video_path, mode="rb") as video:
-                while chunk := video.read(8192):  # 8KB chunks
-                    yield chunk
-
-        headers = {
-            'Accept-Ranges': 'bytes',
-            'Content-Length': str(file_size),
-            'Content-Type': 'video/mp4',
-        }
-
-        return StreamingResponse(
-            normal_stream(),
-            headers=headers,
-            media_type="video/mp4"
-        )
+        # 单段/多段Range和If-Range校验由RangeFileResponse处理，按请求的范围返回而不是固定1MB
+        return RangeFileResponse(video_path, media_type='video/mp4')
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
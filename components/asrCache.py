@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+
+def hash_bytes(data):
+    """计算音频内容的SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """分块计算文件的SHA-256，结果与hash_bytes一致"""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ASRCache:
+    """
+    以音频内容哈希为键的ASR结果磁盘缓存
+
+    键由音频的SHA-256、模型与VAD参数以及影响结果的请求参数共同决定，
+    任一参数变化都不会命中旧结果。总大小超过max_bytes时按最近使用时间淘汰。
+
+    Args:
+        cache_dir (str): 缓存目录
+        max_bytes (int): 缓存总大小上限
+        params (dict): 模型与VAD参数
+    """
+
+    def __init__(self, cache_dir, max_bytes, params):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.params = params
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, audio_hash, options=None):
+        payload = json.dumps([audio_hash, self.params, options or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, audio_hash, options=None, with_meta=False):
+        """
+        命中时返回缓存的结果并刷新其使用时间，否则返回None
+
+        with_meta为True时返回(结果, 写入时附带的meta)，未命中时为(None, None)
+        """
+        path = self._path(self.key(audio_hash, options))
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return (None, None) if with_meta else None
+        # 旧版本的条目直接保存结果，没有meta
+        if not isinstance(entry, dict) or 'result' not in entry:
+            entry = {'result': entry, 'meta': {}}
+        return (entry['result'], entry['meta']) if with_meta else entry['result']
+
+    def put(self, audio_hash, options, result, meta=None):
+        """写入结果及可选的meta（如片段数统计），随后按需淘汰最久未使用的条目"""
+        path = self._path(self.key(audio_hash, options))
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'result': result, 'meta': meta or {}}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """总大小超过上限时，按修改时间从旧到新删除条目"""
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,179 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+
+class ASRJobManager:
+    """
+    ASR异步任务队列
+
+    上传的音频先落盘并进入有界队列，由后台线程依次处理。
+    任务状态和识别结果保存在job_dir中，服务重启后已完成的任务仍可查询，
+    未完成的任务会重新入队。
+
+    Args:
+        job_dir (str): 任务文件目录
+        handler (callable): handler(audio_bytes, options, report)，report(progress)用于上报0~1的进度，返回识别结果
+        workers (int): 后台线程数
+        queue_size (int): 排队任务上限，超出时submit抛出queue.Full
+        ttl (int): 已结束任务保留的秒数
+        purge_interval (int): 清理过期任务的间隔秒数
+    """
+
+    def __init__(self, job_dir, handler, workers=1, queue_size=16, ttl=7 * 24 * 3600, purge_interval=3600):
+        self.job_dir = job_dir
+        self.handler = handler
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        os.makedirs(job_dir, exist_ok=True)
+        recovered = self._recover()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+        if recovered:
+            threading.Thread(target=self._enqueue, args=(recovered,), daemon=True).start()
+        threading.Thread(target=self._purger, daemon=True).start()
+
+    def _path(self, job_id, ext):
+        return os.path.join(self.job_dir, f"{job_id}.{ext}")
+
+    def _save(self, job):
+        """先写临时文件再替换，避免读到写了一半的状态"""
+        job['updated_at'] = time.time()
+        tmp_path = self._path(job['job_id'], "json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(job['job_id'], "json"))
+
+    def _load(self, job_id):
+        try:
+            with open(self._path(job_id, "json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _recover(self):
+        """服务重启后，找出音频仍在的未完成任务并重置为排队状态，返回按创建时间排序的job_id"""
+        recovered = []
+        for name in os.listdir(self.job_dir):
+            if not name.endswith(".json"):
+                continue
+            job = self._load(name[:-len(".json")])
+            if not job or job['status'] not in ("queued", "running"):
+                continue
+            if not os.path.exists(self._path(job['job_id'], "audio")):
+                job.update(status="failed", error="任务中断且音频已丢失")
+                self._save(job)
+                continue
+            job.update(status="queued", progress=0.0)
+            self._save(job)
+            recovered.append((job['created_at'], job['job_id']))
+        return [job_id for _, job_id in sorted(recovered)]
+
+    def _enqueue(self, job_ids):
+        """恢复的任务可能超过队列上限，在后台随队列空出依次入队，不会遗留永远排队的任务"""
+        for job_id in job_ids:
+            self.queue.put(job_id)
+
+    def purge_expired(self):
+        """
+        删除超过保留期的已结束任务
+
+        任务文件每次更新都会重写，先按文件修改时间筛选，只读取已过期的文件确认状态，
+        不必加载每个任务的识别结果
+        """
+        deadline = time.time() - self.ttl
+        with os.scandir(self.job_dir) as entries:
+            expired = [entry.name for entry in entries if entry.name.endswith(".json") and entry.stat().st_mtime < deadline]
+        for name in expired:
+            job = self._load(name[:-len(".json")])
+            if job and job['status'] in ("done", "failed"):
+                os.remove(self._path(job['job_id'], "json"))
+
+    def _purger(self):
+        while True:
+            try:
+                self.purge_expired()
+            except OSError as e:
+                print(f"清理过期ASR任务失败: {str(e)}")
+            time.sleep(self.purge_interval)
+
+    def submit(self, audio, options=None):
+        """提交任务，返回任务信息；队列已满时抛出queue.Full。需要把音频写盘，应在线程中调用"""
+        if self.queue.full():
+            raise queue.Full
+        job_id = uuid.uuid4().hex
+        with open(self._path(job_id, "audio"), 'wb') as f:
+            f.write(audio)
+        job = {
+            'job_id': job_id,
+            'status': "queued",
+            'progress': 0.0,
+            'options': options or {},
+            'error': None,
+            'created_at': time.time()
+        }
+        self._save(job)
+        try:
+            self.queue.put_nowait(job_id)
+        except queue.Full:
+            os.remove(self._path(job_id, "audio"))
+            os.remove(self._path(job_id, "json"))
+            raise
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """查询任务状态（不含识别结果），任务不存在时返回None"""
+        job = self._load(job_id)
+        if job:
+            job.pop('result', None)
+        return job
+
+    def result(self, job_id):
+        """返回已完成任务的完整信息（含识别结果），任务不存在时返回None"""
+        return self._load(job_id)
+
+    def _worker(self):
+        while True:
+            job_id = self.queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                self.queue.task_done()
+
+    def _run(self, job_id):
+        job = self._load(job_id)
+        if not job:
+            return
+        job['status'] = "running"
+        self._save(job)
+        last_report = [0.0]
+
+        def report(progress):
+            # 进度写盘有开销，至少变化1%才更新
+            if progress - last_report[0] >= 0.01:
+                last_report[0] = progress
+                with self.lock:
+                    job['progress'] = round(min(progress, 1.0), 4)
+                    self._save(job)
+
+        audio_path = self._path(job_id, "audio")
+        try:
+            with open(audio_path, 'rb') as f:
+                audio = f.read()
+            result = self.handler(audio, job['options'], report)
+            with self.lock:
+                job.update(status="done", progress=1.0, result=result)
+                self._save(job)
+        except Exception as e:
+            print(f"ASR任务{job_id}失败: {str(e)}")
+            with self.lock:
+                job.update(status="failed", error=str(e))
+                self._save(job)
+        finally:
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
@@ -0,0 +1,70 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatchScheduler:
+    """
+    跨请求的动态批处理调度器
+
+    各请求提交的片段进入同一个队列，后台线程把它们凑成批次统一调用fn。
+    一批凑满max_batch_size，或第一个片段已等待max_wait_ms，就立即执行；
+    每个结果通过Future送回提交它的请求。
+
+    Args:
+        fn (callable): fn(items) -> results，结果与items一一对应
+        max_batch_size (int): 每批最多片段数
+        max_wait_ms (float): 凑批的最长等待毫秒数
+    """
+
+    def __init__(self, fn, max_batch_size=16, max_wait_ms=20):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, item):
+        """提交一个片段，返回其结果的Future"""
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def map(self, items, order=None):
+        """
+        提交一组片段并等待全部结果，返回顺序与items一致
+
+        order可指定提交顺序（如按时长排序），使同一批内的片段长度接近
+        """
+        order = order if order is not None else range(len(items))
+        futures = {i: self.submit(items[i]) for i in order}
+        return [futures[i].result() for i in range(len(items))]
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
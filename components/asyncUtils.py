@@ -0,0 +1,21 @@
+import asyncio
+import functools
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from settings import BLOCKING_WORKERS
+
+# 下载大文件、提取音频等耗时的磁盘/CPU任务使用的有界线程池，避免占满事件循环的默认线程池
+BLOCKING_EXECUTOR = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在有界线程池中执行阻塞函数，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BLOCKING_EXECUTOR, functools.partial(func, *args, **kwargs))
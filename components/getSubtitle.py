@@ -1,8 +1,12 @@
 import requests
 import openai
+import json
 import time
+import asyncio
+import httpx
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # Add project root to path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -10,76 +14,176 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from components.processVideo import extract_bv_and_p_from_url, get_video_info, get_video_cid_aid
+from components.asrCache import hash_file
+from components.httpClient import http_get, async_http_get, get_async_client
+from components.asyncUtils import run_blocking
 from settings import OPENAI_BASE_URL, OPENAI_API_KEY, ASR_URL, ASR_CHECK_PROMPT, BILIBILI_COOKIE
 
 
-def get_subtitle_from_bilibili(aid, cid, cookies=None, max_retries=3):
-    """从B站API获取字幕，支持重试"""
-    headers = {
+def subtitle_headers(cookies=None):
+    """获取字幕时使用的请求头"""
+    return {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/111.0.0.0 Safari/537.36',
         'Accept-Language': 'zh-CN,zh;q=0.9',
         'Referer': 'https://www.bilibili.com/',
         "cookie": cookies or BILIBILI_COOKIE
     }
-    
+
+
+SUBTITLE_URL_KEYS = ('subtitle_url', 'subtitle_url_v2')
+
+
+def select_subtitle_tracks(subtitles, languages=None):
+    """
+    按语言筛选字幕轨道
+
+    languages中的每一项可以是语言代码（如zh-CN、ai-zh）或语言名称（如中文（中国）），为None时保留全部轨道
+    """
+    if not languages:
+        return subtitles
+    wanted = set(languages)
+    return [s for s in subtitles if s.get('lan') in wanted or s.get('lan_doc') in wanted]
+
+
+def subtitle_requests(subtitles):
+    """展开所有轨道的v1/v2地址，返回[(轨道序号, 地址名, url)]，同一轨道内v1在前"""
+    return [(i, key, f"https:{subtitle[key]}")
+            for i, subtitle in enumerate(subtitles)
+            for key in SUBTITLE_URL_KEYS if subtitle.get(key)]
+
+
+def collect_subtitles(subtitles, jobs, bodies):
+    """按轨道原有顺序合并结果，每个轨道取第一个成功的版本（v1优先）"""
+    all_subtitles = []
+    for i, subtitle in enumerate(subtitles):
+        body = next((b for (j, _, _), b in zip(jobs, bodies) if j == i and b is not None), None)
+        if body is not None:
+            all_subtitles.append({
+                "lan": subtitle.get('lan_doc'),
+                "subtitle": body
+            })
+    return all_subtitles
+
+
+def fetch_subtitle_body(subtitle, key, url, headers, timeout):
+    """下载单个字幕文件，失败时返回None"""
+    try:
+        return http_get(url, headers=headers, timeout=timeout).json()["body"]
+    except Exception as e:
+        print(f"获取{subtitle.get('lan_doc')}的{key}字幕失败: {str(e)}")
+        return None
+
+
+async def afetch_subtitle_body(subtitle, key, url, headers, timeout):
+    """fetch_subtitle_body的异步版本"""
+    try:
+        response = await async_http_get(url, headers=headers, timeout=timeout)
+        return response.json()["body"]
+    except Exception as e:
+        print(f"获取{subtitle.get('lan_doc')}的{key}字幕失败: {str(e)}")
+        return None
+
+
+def get_subtitle_from_bilibili(aid, cid, cookies=None, max_retries=3, languages=None, track_timeout=10):
+    """
+    从B站API获取字幕，支持重试
+
+    所有轨道及其v1/v2地址并发下载，耗时约为一次往返；单个字幕文件最多等待track_timeout秒。
+    languages指定需要的语言（见select_subtitle_tracks），其余轨道不下载。
+    """
+    headers = subtitle_headers(cookies)
     for attempt in range(max_retries):
         try:
             player_url = f"https://api.bilibili.com/x/player/wbi/v2?aid={aid}&cid={cid}"
-            player_response = requests.get(player_url, headers=headers)
+            player_response = http_get(player_url, headers=headers)
             if player_response.status_code == 200:
-                player_data = player_response.json()
-                subtitles = player_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
-                
-                # 存储所有成功获取的字幕
-                all_subtitles = []
-                
-                # 遍历每个字幕
-                for subtitle in subtitles:
-                    lan_doc = subtitle.get('lan_doc')
-                    subtitle_data = None
-                    
-                    # 尝试获取v1版本字幕
-                    try:
-                        subtitle_v1 = requests.get(f"https:{subtitle.get('subtitle_url')}", headers=headers)
-                        subtitle_data = subtitle_v1.json()["body"]
-                        all_subtitles.append({
-                            "lan": lan_doc,
-                            "subtitle": subtitle_data
-                        })
-                        continue  # 如果v1成功，直接处理下一个字幕
-                    except Exception as e:
-                        print(f"获取{lan_doc}的v1字幕失败: {str(e)}")
-                    
-                    # 如果v1失败且存在v2，尝试获取v2版本字幕
-                    if subtitle.get('subtitle_url_v2'):
-                        try:
-                            subtitle_v2 = requests.get(f"https:{subtitle.get('subtitle_url_v2')}", headers=headers)
-                            subtitle_data = subtitle_v2.json()["body"]
-                            all_subtitles.append({
-                                "lan": lan_doc,
-                                "subtitle": subtitle_data
-                            })
-                        except Exception as e:
-                            print(f"获取{lan_doc}的v2字幕失败: {str(e)}")
+                subtitles = player_response.json().get('data', {}).get('subtitle', {}).get('subtitles', [])
+                subtitles = select_subtitle_tracks(subtitles, languages)
+                jobs = subtitle_requests(subtitles)
+                if jobs:
+                    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                        bodies = list(executor.map(
+                            lambda job: fetch_subtitle_body(subtitles[job[0]], job[1], job[2], headers, track_timeout),
+                            jobs
+                        ))
+                    all_subtitles = collect_subtitles(subtitles, jobs, bodies)
+                    if all_subtitles:
+                        return all_subtitles
+            if attempt < max_retries - 1:
+                print(f"第{attempt + 1}次获取字幕失败，等待1秒后重试...")
+                time.sleep(1)
+        except Exception as e:
+            if attempt < max_retries - 1:
+                print(f"第{attempt + 1}次获取字幕出错: {str(e)}，等待1秒后重试...")
+                time.sleep(1)
+            else:
+                print(f"最后一次尝试失败: {str(e)}")
+    return None
+
+
+async def aget_subtitle_from_bilibili(aid, cid, cookies=None, max_retries=3, languages=None, track_timeout=10):
+    """get_subtitle_from_bilibili的异步版本，字幕文件用asyncio.gather并发下载，重试间隔不阻塞事件循环"""
+    headers = subtitle_headers(cookies)
+    for attempt in range(max_retries):
+        try:
+            player_url = f"https://api.bilibili.com/x/player/wbi/v2?aid={aid}&cid={cid}"
+            player_response = await async_http_get(player_url, headers=headers)
+            if player_response.status_code == 200:
+                subtitles = player_response.json().get('data', {}).get('subtitle', {}).get('subtitles', [])
+                subtitles = select_subtitle_tracks(subtitles, languages)
+                jobs = subtitle_requests(subtitles)
+                bodies = await asyncio.gather(*(
+                    afetch_subtitle_body(subtitles[i], key, url, headers, track_timeout) for i, key, url in jobs
+                ))
+                all_subtitles = collect_subtitles(subtitles, jobs, bodies)
                 if all_subtitles:
                     return all_subtitles
-                    
-            # 如果这次尝试失败，但还有重试机会
             if attempt < max_retries - 1:
                 print(f"第{attempt + 1}次获取字幕失败，等待1秒后重试...")
-                time.sleep(1)  # 等待1秒后重试
-            
+                await asyncio.sleep(1)
         except Exception as e:
             if attempt < max_retries - 1:
                 print(f"第{attempt + 1}次获取字幕出错: {str(e)}，等待1秒后重试...")
-                time.sleep(1)
+                await asyncio.sleep(1)
             else:
                 print(f"最后一次尝试失败: {str(e)}")
     return None
 
 
+def wait_asr_job(job_id, poll_interval=5, timeout=7200):
+    """
+    轮询ASR任务直到完成并返回结果
+
+    轮询中的网络错误只会重试，不会丢失服务端正在进行的任务
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            job = requests.get(f"{ASR_URL}/jobs/{job_id}", timeout=30).json()
+            if job.get('status') == "done":
+                res = requests.get(f"{ASR_URL}/jobs/{job_id}/result", timeout=60)
+                res.raise_for_status()
+                return res.json()
+            if job.get('status') == "failed":
+                raise Exception(f"ASR任务失败: {job.get('error')}")
+            if 'status' not in job:
+                raise Exception(f"ASR任务不存在: {job_id}")
+        except requests.exceptions.RequestException as e:
+            print(f"查询ASR任务{job_id}出错: {str(e)}，稍后重试...")
+        time.sleep(poll_interval)
+    raise Exception(f"ASR任务{job_id}超时")
+
+
 def get_subtitle_from_ai(audio_dir, ai_check=False):
-    subtitle_res = requests.post(ASR_URL, files={"file": open(audio_dir, 'rb')}, timeout=7200).json()
+    # 服务端已识别过相同音频时直接取结果，不再上传
+    cached = requests.get(f"{ASR_URL}/cache/{hash_file(audio_dir)}", timeout=30)
+    if cached.status_code == 200:
+        subtitle_res = cached.json()
+    else:
+        with open(audio_dir, 'rb') as f:
+            job = requests.post(f"{ASR_URL}/jobs", files={"file": f}, timeout=600)
+        job.raise_for_status()
+        subtitle_res = wait_asr_job(job.json()['job_id'])
     client = openai.OpenAI(
         api_key=OPENAI_API_KEY,
         base_url=OPENAI_BASE_URL
@@ -93,6 +197,94 @@ def get_subtitle_from_ai(audio_dir, ai_check=False):
     return subtitle_res
 
 
+async def await_asr_job(job_id, poll_interval=5, timeout=7200):
+    """wait_asr_job的异步版本"""
+    client = get_async_client()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            job = (await client.get(f"{ASR_URL}/jobs/{job_id}", timeout=30)).json()
+            if job.get('status') == "done":
+                res = await client.get(f"{ASR_URL}/jobs/{job_id}/result", timeout=60)
+                res.raise_for_status()
+                return res.json()
+            if job.get('status') == "failed":
+                raise Exception(f"ASR任务失败: {job.get('error')}")
+            if 'status' not in job:
+                raise Exception(f"ASR任务不存在: {job_id}")
+        except httpx.HTTPError as e:
+            print(f"查询ASR任务{job_id}出错: {str(e)}，稍后重试...")
+        await asyncio.sleep(poll_interval)
+    raise Exception(f"ASR任务{job_id}超时")
+
+
+async def aget_subtitle_from_ai(audio_dir, ai_check=False):
+    """get_subtitle_from_ai的异步版本"""
+    client = get_async_client()
+    # 服务端已识别过相同音频时直接取结果，不再上传
+    audio_hash = await run_blocking(hash_file, audio_dir)
+    cached = await client.get(f"{ASR_URL}/cache/{audio_hash}", timeout=30)
+    if cached.status_code == 200:
+        subtitle_res = cached.json()
+    else:
+        with open(audio_dir, 'rb') as f:
+            job = await client.post(f"{ASR_URL}/jobs", files={"file": f}, timeout=600)
+        job.raise_for_status()
+        subtitle_res = await await_asr_job(job.json()['job_id'])
+    if ai_check:
+        openai_client = openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL
+        )
+        chat = await openai_client.chat.completions.create(model="gpt-3.5-turbo", messages=[
+            {"role": "system", "content": ASR_CHECK_PROMPT},
+            {"role": "user", "content": f"以下是需要校对的字幕文本：{subtitle_res}"}
+        ])
+        subtitle_res = chat.choices[0].message.content
+    return subtitle_res
+
+
+def iter_subtitle_from_ai(audio_dir, read_timeout=600, windowed=False):
+    """
+    流式获取AI字幕
+
+    调用ASR服务的流式接口，每识别完一个片段就产出一个 {from, to, location, content}，
+    不必等待整个文件识别完成
+
+    Args:
+        audio_dir (str): 音频文件路径
+        read_timeout (int): 两个片段之间允许的最长等待秒数
+        windowed (bool): 使用按窗口解码的接口，适合数小时的超长音频
+    """
+    with open(audio_dir, 'rb') as f:
+        if windowed:
+            # 请求体直接是文件内容，服务端边接收边解码
+            yield from post_ndjson(f"{ASR_URL}/windowed", read_timeout, data=f,
+                                   headers={"Content-Type": "application/octet-stream"})
+        else:
+            yield from post_ndjson(f"{ASR_URL}/stream", read_timeout, files={"file": f})
+
+
+def iter_subtitle_from_audio_stream(chunks, read_timeout=600):
+    """
+    上传音频字节流并流式获取AI字幕
+
+    chunks是音频字节的迭代器（如processVideo.iter_audio的输出），以分块传输编码边产生边上传到
+    ASR服务的按窗口识别接口，全程不写中间文件
+    """
+    yield from post_ndjson(f"{ASR_URL}/windowed", read_timeout, data=chunks,
+                           headers={"Content-Type": "application/octet-stream"})
+
+
+def post_ndjson(url, read_timeout, **kwargs):
+    """发送请求并逐行解析NDJSON响应"""
+    with requests.post(url, stream=True, timeout=(30, read_timeout), **kwargs) as res:
+        res.raise_for_status()
+        for line in res.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
 if __name__ == '__main__':
     # 既没有手工字幕也没有AI字幕
     # url = "https://www.bilibili.com/video/BV1wy4y1D7JT/?p=3&spm_id_from=333.788.top_right_bar_window_history.content.click&vd_source=51187f45b082dafba052581f0233ba2e"
@@ -110,4 +302,9 @@ if __name__ == '__main__':
 
     # audio_path = "./bilibili_video/BV1wy4y1D7JT_p3_audio.mp3"
     # res = get_subtitle_from_ai(audio_path)
-    # print(res)
\ No newline at end of file
+    # print(res)
+    # for segment in iter_subtitle_from_ai(audio_path):
+    #     print(segment)
+    # from components.processVideo import iter_audio
+    # for segment in iter_subtitle_from_audio_stream(iter_audio("./bilibili_video/BV1wy4y1D7JT_p3.mp4")):
+    #     print(segment)
\ No newline at end of file
@@ -0,0 +1,101 @@
+import asyncio
+import http.cookiejar
+import os
+import sys
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from settings import HTTP_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF, HTTP_POOL_SIZE
+
+
+def create_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+    """
+    创建带连接池和重试的会话
+
+    每个host最多保持pool_size个长连接，连接用满时请求排队等待而不是新建连接；
+    连接失败和429/5xx响应按backoff指数退避重试，并遵循Retry-After
+    """
+    session = requests.Session()
+    # 共享会话不保存任何cookie，各请求显式携带自己的Cookie头，避免不同用户的登录态互相串用
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=None,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# 进程内共享的会话，所有访问B站的请求都经过它以复用TCP+TLS连接
+session = create_session()
+
+
+def http_request(method, url, **kwargs):
+    """通过共享会话发送请求，未指定timeout时使用HTTP_TIMEOUT"""
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    return session.request(method, url, **kwargs)
+
+
+def http_get(url, **kwargs):
+    return http_request("GET", url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    return http_request("POST", url, **kwargs)
+
+
+# 异步客户端与事件循环绑定，首次使用时创建
+_async_client = None
+
+
+def get_async_client():
+    """返回共享的httpx异步客户端，连接池上限、超时和cookie策略与同步会话一致"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        jar = http.cookiejar.CookieJar(policy=http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        _async_client = httpx.AsyncClient(
+            cookies=jar,
+            timeout=HTTP_TIMEOUT,
+            # 传入transport时httpx忽略客户端的limits，连接池上限需设置在transport上
+            transport=httpx.AsyncHTTPTransport(
+                retries=HTTP_RETRIES,
+                limits=httpx.Limits(max_connections=HTTP_POOL_SIZE * 4, max_keepalive_connections=HTTP_POOL_SIZE)
+            ),
+            follow_redirects=True
+        )
+    return _async_client
+
+
+async def async_http_request(method, url, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, **kwargs):
+    """
+    通过共享异步客户端发送请求
+
+    连接错误由transport重试；429/5xx响应按backoff指数退避重试，与同步会话的策略一致
+    """
+    client = get_async_client()
+    for attempt in range(retries + 1):
+        response = await client.request(method, url, **kwargs)
+        if response.status_code not in (429, 500, 502, 503, 504) or attempt == retries:
+            return response
+        await asyncio.sleep(backoff * (2 ** attempt))
+
+
+async def async_http_get(url, **kwargs):
+    return await async_http_request("GET", url, **kwargs)
+
+
+async def async_http_post(url, **kwargs):
+    return await async_http_request("POST", url, **kwargs)
@@ -1,10 +1,17 @@
-import requests
 import qrcode
 import time
 import json
 import os
+import sys
 from PIL import Image
 
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from components.httpClient import http_get
+
 # 添加请求头
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -19,7 +26,7 @@ def generate_qrcode():
     try:
         # 获取二维码内容
         generate_url = "https://passport.bilibili.com/x/passport-login/web/qrcode/generate"
-        response = requests.get(generate_url, headers=HEADERS)
+        response = http_get(generate_url, headers=HEADERS)
         
         # 检查响应状态码
         if response.status_code != 200:
@@ -69,7 +76,7 @@ def poll_login_status(qrcode_key):
     
     try:
         while True:
-            response = requests.get(poll_url, params=params, headers=HEADERS)  # 添加headers
+            response = http_get(poll_url, params=params, headers=HEADERS)  # 添加headers
             
             if response.status_code != 200:
                 print(f"\n请求失败，状态码: {response.status_code}")
@@ -0,0 +1,136 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    """
+    进程内带过期时间的LRU缓存，并对并发加载做合并（single-flight）
+
+    同一个键同时只会有一次加载在进行，其他调用者等待并共享这次加载的结果；
+    加载失败不会被缓存。同步调用用get_or_load，协程中用aget_or_load，两者共享缓存条目。
+
+    Args:
+        ttl (float): 条目的有效秒数
+        maxsize (int): 最多保存的条目数，超出时淘汰最久未使用的条目
+    """
+
+    def __init__(self, ttl, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.inflight = {}
+        self.ainflight = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        """调用方需持有锁；命中且未过期时返回(True, value)"""
+        item = self.data.get(key)
+        if item is None:
+            return False, None
+        expires, value = item
+        if expires < time.monotonic():
+            del self.data[key]
+            return False, None
+        self.data.move_to_end(key)
+        return True, value
+
+    def _set(self, key, value):
+        """调用方需持有锁"""
+        self.data[key] = (time.monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """命中时直接返回，否则调用loader()加载；并发的相同键只加载一次"""
+        with self.lock:
+            hit, value = self._get(key)
+            if hit:
+                return value
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            value = loader()
+        except Exception as e:
+            with self.lock:
+                self.inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self._set(key, value)
+            self.inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    async def aget_or_load(self, key, loader):
+        """get_or_load的协程版本，loader()返回协程；并发的相同键只await一次"""
+        with self.lock:
+            hit, value = self._get(key)
+            if hit:
+                return value
+        while (future := self.ainflight.get(key)) is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 加载者被取消时由等待者重新加载，不把取消传给没有被取消的等待者
+                if not future.cancelled():
+                    raise
+        future = self.ainflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await loader()
+        except BaseException as e:
+            self.ainflight.pop(key, None)
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                # 没有其他等待者时避免"exception was never retrieved"告警
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        with self.lock:
+            self._set(key, value)
+        self.ainflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key=None):
+        """删除指定键，不指定时清空缓存"""
+        with self.lock:
+            if key is None:
+                self.data.clear()
+            else:
+                self.data.pop(key, None)
+
+
+def ttl_cache(ttl, maxsize=256, cache=None):
+    """
+    以函数的全部参数为键，用TTLCache缓存函数结果的装饰器，缓存对象可通过func.cache访问
+
+    同时支持普通函数和协程函数；传入cache可让同步和异步版本共享同一份缓存
+    """
+    def decorator(func):
+        func_cache = cache or TTLCache(ttl, maxsize)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = (args, tuple(sorted(kwargs.items())))
+                return await func_cache.aget_or_load(key, lambda: func(*args, **kwargs))
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = (args, tuple(sorted(kwargs.items())))
+                return func_cache.get_or_load(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = func_cache
+        return wrapper
+    return decorator
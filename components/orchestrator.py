@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from components.singleFlight import SingleFlight, HostSemaphore
+
+
+class Stage:
+    """
+    流水线中的一个阶段
+
+    Args:
+        name (str): 阶段名
+        fn (callable): async fn(context, results)，context为任务参数，results为已完成阶段的结果；
+            返回值需可JSON序列化，会作为该阶段的结果保存
+        deps (tuple): 依赖的阶段名
+        concurrency (int): 本机同时执行该阶段的最大任务数（所有worker进程共享）
+        retries (int): 失败后的重试次数
+        backoff (float): 第一次重试前等待的秒数，之后每次翻倍
+        recheck (bool): 产物完成后仍可能被删除（如会被缓存淘汰的视频）时设为True，
+            每次submit都重新执行该阶段，fn需在产物已存在时快速返回
+    """
+
+    def __init__(self, name, fn, deps=(), concurrency=1, retries=2, backoff=5, recheck=False):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.recheck = recheck
+
+
+class Orchestrator:
+    """
+    本地的分阶段任务编排器
+
+    每个任务（如一个分P）只执行targets及其依赖的阶段，依赖满足后互不依赖的阶段并发执行。
+    各阶段的状态（pending/running/done/failed）、尝试次数、错误和结果保存在job_dir下的JSON文件中：
+    已完成的阶段不会重做；失败的阶段按退避重试，用尽重试后依赖它的阶段不再执行，再次submit时从失败处重试。
+    服务重启后调用recover，未完成的任务从中断的阶段继续。
+    多个worker进程提交同一任务时，以任务文件锁保证同一时刻只有一个进程执行它，
+    其他进程等锁释放后以磁盘上的最新状态为准，只补做尚未完成的阶段。
+
+    Args:
+        job_dir (str): 任务文件目录
+        stages (list[Stage]): 阶段列表，被依赖的阶段需排在前面
+        lock_dir (str): 各阶段并发槽位文件的目录
+    """
+
+    def __init__(self, job_dir, stages, lock_dir):
+        self.job_dir = job_dir
+        self.stages = {stage.name: stage for stage in stages}
+        self.semaphores = {
+            stage.name: HostSemaphore(lock_dir, f"stage_{stage.name}", stage.concurrency) for stage in stages
+        }
+        # 本进程中正在执行的任务：job_id -> (任务状态, asyncio.Task)
+        self.active = {}
+        # 不落盘的任务参数（如用户cookie）
+        self.runtime = {}
+        # 任务文件锁：持有锁的进程才能执行任务、写任务文件
+        self.job_locks = SingleFlight(job_dir)
+        self.owned = set()
+        self.recover_lock = None
+        os.makedirs(job_dir, exist_ok=True)
+
+    def _path(self, job_id, ext):
+        return os.path.join(self.job_dir, f"{job_id}.{ext}")
+
+    def _save(self, job):
+        """先写临时文件再替换，避免读到写了一半的状态"""
+        job['updated_at'] = time.time()
+        tmp_path = self._path(job['job_id'], f"json.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(job['job_id'], "json"))
+
+    def _load(self, job_id):
+        try:
+            with open(self._path(job_id, "json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def closure(self, targets):
+        """targets及其全部依赖的阶段名，按定义顺序排列"""
+        needed = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in needed]
+
+    def _reset(self, job, targets=()):
+        """追加targets，并把其中失败的阶段和需要复查的已完成阶段重置为待执行"""
+        job['targets'] = [name for name in self.stages if name in set(job['targets']) | set(targets)]
+        for name in self.closure(job['targets']):
+            state = job['stages'].setdefault(name, {'status': "pending", 'attempts': 0, 'error': None, 'result': None})
+            if state['status'] == "failed" or (state['status'] == "done" and self.stages[name].recheck):
+                state.update(status="pending", attempts=0)
+        job['status'] = "running"
+
+    def submit(self, job_id, targets, context=None, runtime=None):
+        """
+        提交任务或为已有任务追加targets，失败的阶段重置为待执行，任务未在执行时启动它
+
+        context随任务保存，重启后用于恢复；runtime只保存在内存中，重启后为空。
+        返回任务状态。
+        """
+        job = self.active[job_id][0] if job_id in self.active else self._load(job_id)
+        if not job:
+            job = {'job_id': job_id, 'targets': [], 'context': {}, 'stages': {}, 'created_at': time.time()}
+        job['context'].update(context or {})
+        self._reset(job, targets)
+        if job_id in self.owned:
+            self._save(job)
+        if runtime:
+            self.runtime[job_id] = runtime
+        if job_id not in self.active:
+            self.active[job_id] = (job, asyncio.ensure_future(self._run(job)))
+        return job
+
+    def get(self, job_id):
+        """查询任务状态，任务不存在时返回None"""
+        if job_id in self.active:
+            return self.active[job_id][0]
+        return self._load(job_id)
+
+    def recover(self):
+        """
+        服务重启后，继续执行未完成的任务；中断时正在执行的阶段重新执行
+
+        多个worker进程同时启动时只有第一个取得job_dir下恢复锁的进程执行恢复，并持有该锁直到进程退出
+        """
+        if fcntl is not None and self.recover_lock is None:
+            f = open(os.path.join(self.job_dir, ".recover.lock"), 'a')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return
+            self.recover_lock = f
+        count = 0
+        for name in sorted(os.listdir(self.job_dir)):
+            if not name.endswith(".json"):
+                continue
+            job = self._load(name[:-len(".json")])
+            if not job or job['status'] != "running" or job['job_id'] in self.active:
+                continue
+            self.active[job['job_id']] = (job, asyncio.ensure_future(self._run(job)))
+            count += 1
+        if count:
+            print(f"恢复了{count}个未完成的流水线任务")
+
+    def _merge_latest(self, job):
+        """取得任务锁后，以磁盘上的阶段状态为准（等锁期间其他进程可能已推进该任务），保留本进程追加的targets和context"""
+        latest = self._load(job['job_id'])
+        if latest:
+            job['stages'] = latest['stages']
+            job['context'] = {**latest['context'], **job['context']}
+            self._reset(job, latest['targets'])
+        # 持有锁即说明没有其他进程在执行，残留的running是中断留下的
+        for state in job['stages'].values():
+            if state['status'] == "running":
+                state['status'] = "pending"
+
+    async def _run(self, job):
+        job_id = job['job_id']
+        running = {}
+        try:
+            async with self.job_locks.file_lock((job_id,)):
+                self.owned.add(job_id)
+                self._merge_latest(job)
+                self._save(job)
+                while True:
+                    for name in self.closure(job['targets']):
+                        state = job['stages'][name]
+                        deps_done = all(job['stages'][dep]['status'] == "done" for dep in self.stages[name].deps)
+                        if state['status'] == "pending" and name not in running and deps_done:
+                            running[name] = asyncio.ensure_future(self._run_stage(job, name))
+                    if not running:
+                        break
+                    finished, _ = await asyncio.wait(running.values(), return_when=asyncio.FIRST_COMPLETED)
+                    for name in [name for name, task in running.items() if task in finished]:
+                        task = running.pop(name)
+                        if task.exception() is not None:
+                            # 状态写盘等编排本身的错误，阶段记为失败，再次submit时重试
+                            job['stages'][name].update(status="failed", error=str(task.exception()))
+                needed = self.closure(job['targets'])
+                job['status'] = "done" if all(job['stages'][name]['status'] == "done" for name in needed) else "failed"
+                self._save(job)
+        finally:
+            for task in running.values():
+                task.cancel()
+            # 被取消（如服务退出）时，执行中的阶段改回待执行，任务保持running以便recover继续
+            if job_id in self.owned:
+                interrupted = False
+                for state in job['stages'].values():
+                    if state['status'] == "running":
+                        state['status'] = "pending"
+                        interrupted = True
+                if interrupted:
+                    try:
+                        self._save(job)
+                    except OSError as e:
+                        print(f"保存任务{job_id}的状态失败: {str(e)}")
+            self.owned.discard(job_id)
+            self.active.pop(job_id, None)
+            self.runtime.pop(job_id, None)
+
+    async def _run_stage(self, job, name):
+        stage = self.stages[name]
+        state = job['stages'][name]
+        context = {**job['context'], **self.runtime.get(job['job_id'], {})}
+        while True:
+            async with self.semaphores[name].hold():
+                state.update(status="running", attempts=state['attempts'] + 1)
+                self._save(job)
+                try:
+                    results = {dep: job['stages'][dep]['result'] for dep in self.closure(stage.deps)}
+                    result = await stage.fn(context, results)
+                    state.update(status="done", error=None, result=result)
+                    self._save(job)
+                    return
+                except Exception as e:
+                    error = getattr(e, 'detail', None) or str(e)
+                    print(f"任务{job['job_id']}的{name}阶段第{state['attempts']}次执行失败: {error}")
+                    failed = state['attempts'] > stage.retries
+                    state.update(status="failed" if failed else "running", error=error)
+                    self._save(job)
+                    if failed:
+                        return
+            await asyncio.sleep(stage.backoff * 2 ** (state['attempts'] - 1))
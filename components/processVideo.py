@@ -1,4 +1,5 @@
-import requests, time, hashlib, urllib.request, re, json
+import requests, time, hashlib, urllib.request, re, json, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
 from moviepy.editor import VideoFileClip
 import os
 import sys
@@ -8,7 +9,14 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from settings import BILIBILI_COOKIE
+from settings import (
+    BILIBILI_COOKIE, DOWNLOAD_WORKERS, DOWNLOAD_PIECE_SIZE_MB, AUDIO_FORMAT,
+    VIDEO_INFO_TTL, VIDEO_INFO_CACHE_SIZE
+)
+from components.httpClient import http_get, http_post, async_http_get, async_http_post
+from components.memoryCache import ttl_cache
+from components.asyncUtils import run_blocking
+import httpx
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -18,6 +26,13 @@ HEADERS = {
     'Origin': 'https://www.bilibili.com',
     'Cookie': BILIBILI_COOKIE
 }
+# 每次写入磁盘的块大小
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 提取音频的输出格式：(ffmpeg编码参数, 文件扩展名)，均为ASR所需的16kHz单声道
+AUDIO_FORMATS = {
+    "wav": (["-c:a", "pcm_s16le", "-f", "wav"], "wav"),
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"], "ogg"),
+}
 
 def check_folder(fp):
     """检查必要的文件夹是否存在"""
@@ -33,9 +48,12 @@ def extract_bv_and_p_from_url(url):
     return bv_number, int(p_number.group(1)) if p_number else 1
 
 
+@ttl_cache(VIDEO_INFO_TTL, VIDEO_INFO_CACHE_SIZE)
 def get_video_info(bv_number):
     """
     直接从B站API获取视频的元数据信息
+
+    结果在进程内按BV号缓存VIDEO_INFO_TTL秒，同一BV号的并发请求只访问一次B站
     
     Args:
         bv_number (str): 视频的BV号
@@ -46,14 +64,9 @@ def get_video_info(bv_number):
     try:
         # 获取视频基本信息
         view_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bv_number}"
-        response = requests.get(view_url, headers=HEADERS)
+        response = http_get(view_url, headers=HEADERS)
         response.raise_for_status()
-        data = response.json()
-        
-        if data['code'] != 0:
-            raise Exception(f"获取视频信息失败: {data['message']}")
-            
-        video_data = data['data']
+        video_data = parse_video_info(response.json())
         
         # 构建返回的数据结构
         # result = {
@@ -90,6 +103,29 @@ def get_video_info(bv_number):
         raise Exception(f"获取视频信息时发生错误: {str(e)}")
 
 
+def parse_video_info(data):
+    """从B站view接口的响应中取出视频信息"""
+    if data['code'] != 0:
+        raise Exception(f"获取视频信息失败: {data['message']}")
+    return data['data']
+
+
+@ttl_cache(VIDEO_INFO_TTL, cache=get_video_info.cache)
+async def aget_video_info(bv_number):
+    """get_video_info的异步版本，与其共享缓存"""
+    try:
+        view_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bv_number}"
+        response = await async_http_get(view_url, headers=HEADERS)
+        response.raise_for_status()
+        return parse_video_info(response.json())
+    except httpx.HTTPError as e:
+        raise Exception(f"网络请求失败: {str(e)}")
+    except KeyError as e:
+        raise Exception(f"解析视频信息失败: {str(e)}")
+    except Exception as e:
+        raise Exception(f"获取视频信息时发生错误: {str(e)}")
+
+
 def get_video_cid_aid(meta_data, p_number):
     """从元数据中获取指定分P的cid和aid"""
     pages = meta_data.get("pages", [])
@@ -109,23 +145,243 @@ def get_download_url(aid, cid, cookie):
         "cid": cid,
         "cookie": cookie or BILIBILI_COOKIE
     }
-    response = requests.post(download_url, json=post_data)
-    data = response.json()
+    response = http_post(download_url, json=post_data)
+    return parse_download_url(response.json())
+
+
+def parse_download_url(data):
+    """从下载接口的响应中取出下载链接和清晰度"""
     if data["code"] != 0:
         raise Exception(f"下载链接请求失败: {data['message']}")
     return data["data"]["durl"][0]["url"], data["data"].get("quality", "未知")
 
-def download_file(url, file_path):
-    """下载文件"""
+
+async def aget_download_url(aid, cid, cookie):
+    """get_download_url的异步版本"""
+    post_data = {
+        "aid": aid,
+        "cid": cid,
+        "cookie": cookie or BILIBILI_COOKIE
+    }
+    response = await async_http_post("https://bili.zhouql.vip/download/", json=post_data)
+    return parse_download_url(response.json())
+
+
+def get_audio_url(aid, cid, cookie=None):
+    """
+    获取视频的DASH纯音频流链接
+
+    只取码率最低的一路，对语音识别已经足够，体积通常只有整个视频的一小部分
+    """
+    playurl = f"https://api.bilibili.com/x/player/playurl?avid={aid}&cid={cid}&fnval=16&fourk=1"
+    response = http_get(playurl, headers={**HEADERS, 'Cookie': cookie or BILIBILI_COOKIE}, timeout=30)
+    return parse_audio_url(response.json())
+
+
+async def aget_audio_url(aid, cid, cookie=None):
+    """get_audio_url的异步版本"""
+    playurl = f"https://api.bilibili.com/x/player/playurl?avid={aid}&cid={cid}&fnval=16&fourk=1"
+    response = await async_http_get(playurl, headers={**HEADERS, 'Cookie': cookie or BILIBILI_COOKIE}, timeout=30)
+    return parse_audio_url(response.json())
+
+
+def parse_audio_url(data):
+    """从playurl接口的响应中取出码率最低的音频流链接"""
+    if data["code"] != 0:
+        raise Exception(f"音频链接请求失败: {data['message']}")
+    audios = (data["data"].get("dash") or {}).get("audio") or []
+    if not audios:
+        raise Exception("该视频没有DASH音频流")
+    audio = min(audios, key=lambda item: item.get("bandwidth", 0))
+    return audio.get("baseUrl") or audio["base_url"]
+
+
+def probe_content_length(url):
+    """用bytes=0-0请求探测文件大小，服务器不支持Range时返回None；链接过期、无权限等错误状态码直接抛出"""
+    headers = {**HEADERS, 'Range': 'bytes=0-0'}
+    with http_get(url, stream=True, headers=headers, timeout=30) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            return None
+        match = re.match(r'bytes 0-0/(\d+)', response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+
+
+def download_range(url, file_path, start, end):
+    """下载[start, end]字节区间并写入已预分配文件的对应位置"""
+    headers = {**HEADERS, 'Range': f'bytes={start}-{end}'}
+    written = 0
+    with http_get(url, stream=True, headers=headers, timeout=60) as response:
+        if response.status_code != 206:
+            raise Exception(f"分段下载失败，状态码: {response.status_code}")
+        with open(file_path, "r+b", buffering=DOWNLOAD_CHUNK_SIZE) as file:
+            file.seek(start)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                file.write(chunk)
+                written += len(chunk)
+    if written != end - start + 1:
+        raise Exception(f"分段{start}-{end}不完整: {written}字节")
+
+
+def load_checkpoint(part_path, total, piece_size):
+    """读取.part文件旁的断点记录，文件大小或分段大小变化时视为无效"""
     try:
-        response = requests.get(url, stream=True, headers=HEADERS)
-        with open(file_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    file.write(chunk)
+        with open(f"{part_path}.json", 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if (checkpoint['total'] == total and checkpoint['piece_size'] == piece_size
+                and os.path.getsize(part_path) == total):
+            return checkpoint
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    return None
+
+
+def save_checkpoint(part_path, checkpoint):
+    """原子地写入断点记录"""
+    tmp_path = f"{part_path}.json.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, f"{part_path}.json")
+
+
+class DownloadProgress:
+    """
+    正在分段下载的文件的进度，供边下边播读取
+
+    下载线程按分段序号从小到大领取任务；播放端可以通过prioritize让某个位置所在的分段插队，
+    例如拖动进度条到尚未下载的位置，或播放器先读取位于文件末尾的moov。
+    """
+
+    def __init__(self, total, piece_size, done):
+        self.total = total
+        self.piece_size = piece_size
+        self.done = set(done)
+        self.pending = [i for i in range((total + piece_size - 1) // piece_size) if i not in self.done]
+        self.priority = []
+        self.lock = threading.Lock()
+
+    def next_piece(self):
+        """领取下一个要下载的分段，没有时返回None"""
+        with self.lock:
+            while self.priority:
+                index = self.priority.pop(0)
+                if index in self.pending:
+                    self.pending.remove(index)
+                    return index
+            return self.pending.pop(0) if self.pending else None
+
+    def prioritize(self, offset):
+        """让offset所在的分段及其后一个分段优先下载"""
+        with self.lock:
+            index = offset // self.piece_size
+            for i in (index, index + 1):
+                if i in self.pending and i not in self.priority:
+                    self.priority.append(i)
+
+    def mark_done(self, index):
+        with self.lock:
+            self.done.add(index)
+
+
+# 本进程中正在分段下载的文件：绝对路径 -> DownloadProgress
+ACTIVE_DOWNLOADS = {}
+
+
+def get_download_state(file_path):
+    """
+    返回正在下载的文件的(总大小, 分段大小, 已完成分段集合)，没有在下载时返回None
+
+    优先读取本进程的下载进度；其他worker进程在下载时读取.part旁的断点记录
+    """
+    progress = ACTIVE_DOWNLOADS.get(os.path.abspath(file_path))
+    if progress:
+        with progress.lock:
+            return progress.total, progress.piece_size, set(progress.done)
+    try:
+        with open(f"{file_path}.part.json", 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        return checkpoint['total'], checkpoint['piece_size'], set(checkpoint['done'])
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def prioritize_download(file_path, offset):
+    """提示本进程的下载优先获取offset附近的数据，文件不在本进程下载时忽略"""
+    progress = ACTIVE_DOWNLOADS.get(os.path.abspath(file_path))
+    if progress:
+        progress.prioritize(offset)
+
+
+def download_file(url, file_path, workers=DOWNLOAD_WORKERS):
+    """
+    下载文件
+
+    数据先写入file_path.part，全部完成并校验大小后才原子地重命名为file_path，
+    因此file_path存在即代表文件完整。
+    服务器支持Range时，先探测文件大小并预分配，再用多个连接并发下载各个分段；
+    每完成一个分段就记录到file_path.part.json，失败后再次调用只下载缺失的分段。
+    下载期间进度登记在ACTIVE_DOWNLOADS中，可以边下载边播放（见get_download_state）。
+    不支持Range时退回单连接下载。
+    """
+    part_path = f"{file_path}.part"
+    key = os.path.abspath(file_path)
+    try:
+        total = probe_content_length(url) if workers > 1 else None
+        if not total:
+            with http_get(url, stream=True, headers=HEADERS, timeout=60) as response:
+                response.raise_for_status()
+                # 有压缩编码时Content-Length是压缩后的大小，无法用来校验
+                expected = None if response.headers.get('Content-Encoding') else response.headers.get('Content-Length')
+                with open(part_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        file.write(chunk)
+            if expected is not None and os.path.getsize(part_path) != int(expected):
+                raise Exception(f"文件大小不符: {os.path.getsize(part_path)} != {expected}")
+            os.replace(part_path, file_path)
+            return True
+        piece_size = DOWNLOAD_PIECE_SIZE_MB * 1024 * 1024
+        checkpoint = load_checkpoint(part_path, total, piece_size)
+        if checkpoint:
+            print(f"从断点继续下载: 已完成{len(checkpoint['done'])}个分段")
+        else:
+            checkpoint = {'total': total, 'piece_size': piece_size, 'done': []}
+            with open(part_path, "wb") as file:
+                file.truncate(total)
+            save_checkpoint(part_path, checkpoint)
+        progress = ACTIVE_DOWNLOADS[key] = DownloadProgress(total, piece_size, checkpoint['done'])
+        lock = threading.Lock()
+        errors = []
+
+        def fetch_pieces():
+            # 一个分段失败后继续领取其他分段，已成功的分段都会记入断点
+            while (index := progress.next_piece()) is not None:
+                start = index * piece_size
+                try:
+                    download_range(url, part_path, start, min(start + piece_size, total) - 1)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                with lock:
+                    checkpoint['done'].append(index)
+                    save_checkpoint(part_path, checkpoint)
+                progress.mark_done(index)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch_pieces) for _ in range(workers)]
+        for future in futures:
+            future.result()
+        if errors:
+            raise errors[0]
+        if os.path.getsize(part_path) != total:
+            raise Exception(f"文件大小不符: {os.path.getsize(part_path)} != {total}")
+        os.replace(part_path, file_path)
+        os.remove(f"{part_path}.json")
         return True
     except Exception as e:
+        print(f"下载文件失败: {str(e)}")
         return False
+    finally:
+        ACTIVE_DOWNLOADS.pop(key, None)
 
 
 def download_video(video_url, cookie=None):
@@ -145,20 +401,126 @@ def download_video(video_url, cookie=None):
         print("发生错误:", str(e))
         return False
 
-def video2audio(video_path, output_dir="bilibili_video"):
+def download_audio(video_url, cookie=None):
+    """只下载视频的音频流，用于没有字幕时的语音识别，返回音频路径，失败时返回False"""
+    try:
+        bv_number, p_number = extract_bv_and_p_from_url(video_url)
+        meta_data = get_video_info(bv_number)
+        cid, aid = get_video_cid_aid(meta_data, p_number)
+        audio_url = get_audio_url(aid, cid, cookie)
+        check_folder("bilibili_video")
+        file_suffix = f"_p{p_number}" if p_number > 1 else ""
+        audio_path = f"bilibili_video/{bv_number}{file_suffix}_audio.m4a"
+        if download_file(audio_url, audio_path):
+            return audio_path
+        return False
+    except Exception as e:
+        print("下载音频发生错误:", str(e))
+        return False
+
+
+async def adownload_video(video_url, cookie=None):
+    """download_video的异步版本：元数据和下载链接异步获取，文件下载在有界线程池中进行"""
+    try:
+        bv_number, p_number = extract_bv_and_p_from_url(video_url)
+        meta_data = await aget_video_info(bv_number)
+        cid, aid = get_video_cid_aid(meta_data, p_number)
+        download_url, quality = await aget_download_url(aid, cid, cookie)
+        check_folder("bilibili_video")
+        file_suffix = f"_p{p_number}" if p_number > 1 else ""
+        video_path = f"bilibili_video/{bv_number}{file_suffix}.mp4"
+        if await run_blocking(download_file, download_url, video_path):
+            return video_path
+        return False
+    except Exception as e:
+        print("发生错误:", str(e))
+        return False
+
+
+async def adownload_audio(video_url, cookie=None):
+    """download_audio的异步版本"""
+    try:
+        bv_number, p_number = extract_bv_and_p_from_url(video_url)
+        meta_data = await aget_video_info(bv_number)
+        cid, aid = get_video_cid_aid(meta_data, p_number)
+        audio_url = await aget_audio_url(aid, cid, cookie)
+        check_folder("bilibili_video")
+        file_suffix = f"_p{p_number}" if p_number > 1 else ""
+        audio_path = f"bilibili_video/{bv_number}{file_suffix}_audio.m4a"
+        if await run_blocking(download_file, audio_url, audio_path):
+            return audio_path
+        return False
+    except Exception as e:
+        print("下载音频发生错误:", str(e))
+        return False
+
+
+def audio_cmd(video_path, output, fmt=AUDIO_FORMAT):
+    """只解复用音频轨并转为16kHz单声道的ffmpeg命令，-vn跳过视频帧解码"""
+    codec_args, _ = AUDIO_FORMATS[fmt]
+    return ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", video_path,
+            "-vn", "-ac", "1", "-ar", "16000", *codec_args, output]
+
+
+def iter_audio(video_path, fmt=AUDIO_FORMAT, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    边提取边产出音频字节，不写中间文件
+
+    可直接作为请求体上传给ASR服务（见getSubtitle.iter_subtitle_from_audio_stream）
+    """
+    proc = subprocess.Popen(audio_cmd(video_path, "pipe:1", fmt), stdout=subprocess.PIPE)
+    try:
+        while chunk := proc.stdout.read(chunk_size):
+            yield chunk
+    finally:
+        proc.stdout.close()
+        if proc.wait() != 0:
+            raise Exception(f"提取音频失败: {video_path}")
+
+
+def video2audio(video_path, output_dir="bilibili_video", fmt=AUDIO_FORMAT):
+    """
+    从视频中提取音频
+
+    优先用ffmpeg直接解复用音频轨为16kHz单声道（无视频解码、无有损中转）；
+    ffmpeg不可用时退回moviepy转mp3。
+    先写入本次调用独有的临时文件再原子地重命名，音频路径存在即代表文件完整
+    """
+    tmp_path = None
     try:
         audio_base_name = os.path.splitext(os.path.basename(video_path))[0]
         output_name = f"{audio_base_name}_audio"
         check_folder(output_dir)
+        audio_path = os.path.join(output_dir, f"{output_name}.{AUDIO_FORMATS[fmt][1]}")
+        tmp_path = f"{audio_path}.{os.getpid()}_{threading.get_ident()}.tmp"
+        try:
+            subprocess.run(audio_cmd(video_path, tmp_path, fmt), check=True, capture_output=True)
+            os.replace(tmp_path, audio_path)
+            return audio_path
+        except (FileNotFoundError, subprocess.CalledProcessError) as e:
+            print(f"ffmpeg提取音频失败，改用moviepy: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
         video = VideoFileClip(video_path)
         audio = video.audio
         audio_path = os.path.join(output_dir, f"{output_name}.mp3")
-        audio.write_audiofile(audio_path)
+        # moviepy按扩展名选择输出格式，临时文件保留.mp3结尾
+        tmp_path = f"{audio_path}.{os.getpid()}_{threading.get_ident()}.tmp.mp3"
+        audio.write_audiofile(tmp_path)
         audio.close()
         video.close()
+        os.replace(tmp_path, audio_path)
         return audio_path
     except Exception as e:
         return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def avideo2audio(video_path, output_dir="bilibili_video", fmt=AUDIO_FORMAT):
+    """video2audio的异步版本，在有界线程池中提取音频"""
+    return await run_blocking(video2audio, video_path, output_dir, fmt)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import sys
+import time
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response, MalformedRangeHeader, RangeNotSatisfiable
+
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from settings import VIDEO_CHUNK_SIZE_KB
+from components.processVideo import get_download_state, prioritize_download
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeFileResponse(FileResponse):
+    """
+    支持HTTP Range的视频文件响应
+
+    Range解析、多段multipart/byteranges以及If-Range与ETag/Last-Modified的校验沿用starlette的FileResponse，
+    在此基础上改进发送方式：
+    - ASGI服务器声明支持zero-copy扩展时，整文件和单段Range直接交给内核sendfile，数据不经过Python；
+    - 否则按chunk_size分块读取，默认VIDEO_CHUNK_SIZE_KB，远大于FileResponse的64KB，
+      拖动进度条产生的每个Range请求需要的线程切换和send调用随之减少。
+
+    Args:
+        path (str): 文件路径
+        chunk_size (int): 非zero-copy时每次读取和发送的字节数
+    """
+
+    def __init__(self, path, chunk_size=VIDEO_CHUNK_SIZE_KB * 1024, **kwargs):
+        super().__init__(path, **kwargs)
+        self.chunk_size = chunk_size
+        self.zerocopy = False
+
+    async def __call__(self, scope, receive, send):
+        self.zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _sendfile(self, send, status, offset, count, send_header_only):
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        with open(self.path, 'rb') as f:
+            await send({"type": ZEROCOPY_EXTENSION, "file": f, "offset": offset, "count": count, "more_body": False})
+
+    async def _handle_simple(self, send, send_header_only):
+        if not self.zerocopy:
+            return await super()._handle_simple(send, send_header_only)
+        count = int(self.headers["content-length"])
+        await self._sendfile(send, self.status_code, 0, count, send_header_only)
+
+    async def _handle_single_range(self, send, start, end, file_size, send_header_only):
+        if not self.zerocopy:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await self._sendfile(send, 206, start, end - start, send_header_only)
+
+    async def _handle_multiple_ranges(self, send, ranges, file_size, send_header_only):
+        # starlette 0.41把multipart/byteranges写进了Content-Range，这里移回Content-Type
+        async def fixed_send(message):
+            if message["type"] == "http.response.start":
+                multipart = [v for k, v in message["headers"] if k == b"content-range"]
+                message["headers"] = [(k, v) for k, v in message["headers"] if k not in (b"content-range", b"content-type")]
+                message["headers"].append((b"content-type", multipart[0]))
+            await send(message)
+
+        await super()._handle_multiple_ranges(fixed_send, ranges, file_size, send_header_only)
+
+
+class GrowingFileResponse(Response):
+    """
+    边下载边返回的视频响应
+
+    文件仍在分段下载时，从.part文件读取已下载的分段立即发送，遇到未下载的分段就提示下载器优先获取并等待，
+    下载完成后（.part已改名）继续从同一个文件句柄读取。下载已结束时退回RangeFileResponse。
+    只支持单段Range，多段请求只返回第一段；文件内容尚未固定，不返回ETag。
+
+    Args:
+        path (str): 下载完成后的文件路径
+        alive (callable): 返回下载器是否仍在运行；下载失败或进程退出后残留的断点记录不代表正在下载，
+            此时不开始响应（返回503），已开始的响应立即中断而不是等到stall_timeout
+        chunk_size (int): 每次读取和发送的字节数
+        poll_interval (float): 检查下载进度的间隔（秒）
+        stall_timeout (float): 等待单个分段的最长秒数，超时后中断响应
+    """
+
+    def __init__(self, path, alive, media_type=None, chunk_size=VIDEO_CHUNK_SIZE_KB * 1024, poll_interval=0.2, stall_timeout=120):
+        self.path = path
+        self.alive = alive
+        self.media_type = media_type
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        self.background = None
+        self.status_code = 200
+        self.init_headers()
+
+    async def wait_piece(self, index, offset):
+        """等待第index个分段下载完成，下载中断或超时返回False"""
+        deadline = time.monotonic() + self.stall_timeout
+        prioritized = False
+        while time.monotonic() < deadline:
+            if os.path.exists(self.path):
+                return True
+            state = get_download_state(self.path)
+            if state is None:
+                return False
+            if index in state[2]:
+                return True
+            if not self.alive():
+                return False
+            if not prioritized:
+                prioritize_download(self.path, offset)
+                prioritized = True
+            await asyncio.sleep(self.poll_interval)
+        return False
+
+    async def open_file(self):
+        # .part可能在判断之后刚好改名为完整文件
+        try:
+            return await anyio.open_file(f"{self.path}.part", mode="rb")
+        except FileNotFoundError:
+            return await anyio.open_file(self.path, mode="rb")
+
+    async def __call__(self, scope, receive, send):
+        state = get_download_state(self.path)
+        if state is None:
+            if os.path.exists(self.path):
+                return await RangeFileResponse(self.path, media_type=self.media_type)(scope, receive, send)
+            return await PlainTextResponse("视频尚未下载", status_code=404)(scope, receive, send)
+        if not self.alive():
+            return await PlainTextResponse("视频下载已中断，请重新请求", status_code=503)(scope, receive, send)
+        total, piece_size, _ = state
+
+        start, end = 0, total
+        http_range = Headers(scope=scope).get("range")
+        if http_range is not None:
+            try:
+                start, end = FileResponse._parse_range_header(http_range, total)[0]
+            except MalformedRangeHeader as exc:
+                return await PlainTextResponse(exc.content, status_code=400)(scope, receive, send)
+            except RangeNotSatisfiable as exc:
+                response = PlainTextResponse(status_code=416, headers={"Content-Range": f"*/{exc.max_size}"})
+                return await response(scope, receive, send)
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{total}"
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await self.open_file() as file:
+            await file.seek(start)
+            while start < end:
+                index = start // piece_size
+                if not await self.wait_piece(index, start):
+                    # 响应头已发出，只能中断连接让播放器重试
+                    raise RuntimeError(f"等待{self.path}的第{index}个分段超时或下载已中断")
+                piece_end = min((index + 1) * piece_size, end)
+                while start < piece_end:
+                    chunk = await file.read(min(self.chunk_size, piece_end - start))
+                    if not chunk:
+                        raise RuntimeError(f"{self.path}在{start}字节处意外结束")
+                    start += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": start < end})
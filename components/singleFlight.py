@@ -0,0 +1,138 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，只在进程内去重
+    fcntl = None
+
+
+class SingleFlight:
+    """
+    按键合并并发任务（single-flight），同时在进程内和同一主机的多个worker进程间生效
+
+    进程内：同一个键同时只有一个协程执行loader，其他协程等待并共享它的结果；
+    跨进程：执行loader前先获取lock_dir下该键的文件锁（flock），其他进程在锁上等待。
+    等到锁的进程应在loader中重新检查产物是否已由前一个持锁者生成，而不是直接重做。
+
+    Args:
+        lock_dir (str): 存放锁文件的目录
+        poll_interval (float): 等待其他进程释放文件锁时的轮询间隔（秒）
+    """
+
+    def __init__(self, lock_dir, poll_interval=0.5):
+        self.lock_dir = lock_dir
+        self.poll_interval = poll_interval
+        self.inflight = {}
+
+    def lock_path(self, key):
+        name = "_".join(str(part) for part in key)
+        return os.path.join(self.lock_dir, f"{name}.lock")
+
+    @asynccontextmanager
+    async def file_lock(self, key):
+        """获取键对应的文件锁；锁被其他进程持有时以非阻塞方式轮询，不阻塞事件循环"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(self.lock_path(key), 'a') as f:
+            while True:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(self.poll_interval)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def is_locked(self, key):
+        """键的文件锁当前是否被持有（本进程或其他进程中正在执行loader）"""
+        if fcntl is None:
+            return tuple(key) in self.inflight
+        try:
+            f = open(self.lock_path(key), 'r')
+        except FileNotFoundError:
+            return False
+        with f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            return False
+
+    async def run(self, key, loader):
+        """持有key的锁执行loader()并返回结果；进程内并发的相同键只执行一次"""
+        key = tuple(key)
+        while (future := self.inflight.get(key)) is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 执行loader的请求被取消（如客户端断开）时，等待者自己接手执行，而不是跟着被取消
+                if not future.cancelled():
+                    raise
+        future = self.inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            async with self.file_lock(key):
+                value = await loader()
+        except BaseException as e:
+            self.inflight.pop(key, None)
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                # 没有其他等待者时避免"exception was never retrieved"告警
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        self.inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+
+class HostSemaphore:
+    """
+    同一主机上所有worker进程共享的信号量
+
+    用lock_dir下的limit个槽位文件实现，获取时依次尝试对各槽位加非阻塞flock，都被占用则轮询等待。
+    进程退出时内核自动释放其持有的槽位。没有fcntl时退化为进程内的asyncio.Semaphore。
+
+    Args:
+        lock_dir (str): 存放槽位文件的目录
+        name (str): 信号量名称，用作槽位文件名前缀
+        limit (int): 同时持有的最大数量
+        poll_interval (float): 槽位全被占用时的轮询间隔（秒）
+    """
+
+    def __init__(self, lock_dir, name, limit, poll_interval=0.5):
+        self.lock_dir = lock_dir
+        self.name = name
+        self.limit = limit
+        self.poll_interval = poll_interval
+        self.local = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def hold(self):
+        async with self.local:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.lock_dir, exist_ok=True)
+            while True:
+                for slot in range(self.limit):
+                    f = open(os.path.join(self.lock_dir, f"{self.name}_{slot}.lock"), 'a')
+                    try:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        f.close()
+                        continue
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                        f.close()
+                    return
+                await asyncio.sleep(self.poll_interval)
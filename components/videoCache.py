@@ -0,0 +1,88 @@
+import os
+import re
+import threading
+
+# bilibili_video下的文件名：{BV号}[_p{分P号}][_audio|_subtitle].{扩展名}
+PART_FILE_PATTERN = re.compile(r'^(BV\w{10})(?:_p(\d+))?(?:_audio|_subtitle)?\.\w+$')
+# 下载中的分段文件、断点记录和临时文件不参与淘汰
+SKIP_SUFFIXES = ('.part', '.part.json', '.tmp', '.tmp.mp3')
+
+
+def part_key(file_name):
+    """由文件名得到所属分P (BV号, 分P号)，无法识别的文件返回None"""
+    match = PART_FILE_PATTERN.match(file_name)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2) or 1)
+
+
+class VideoCache:
+    """
+    bilibili_video目录的磁盘配额管理
+
+    与ASRCache一样以文件的修改时间作为最近使用时间：每次返回视频时touch刷新，
+    总大小超过max_bytes时按分P整体淘汰最久未使用的视频及其音频、字幕文件。
+    多个worker进程共享同一目录即可，不需要额外的索引。
+
+    Args:
+        cache_dir (str): 视频目录
+        max_bytes (int): 目录总大小上限，0 表示不限制
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def touch(self, path):
+        """刷新文件的最近使用时间"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def scan(self):
+        """返回{分P或文件名: [最近使用时间, 总大小, 文件路径列表]}和目录总大小"""
+        groups = {}
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.startswith('.') or entry.name.endswith(SKIP_SUFFIXES):
+                continue
+            stat = entry.stat()
+            group = groups.setdefault(part_key(entry.name) or entry.name, [0, 0, []])
+            group[0] = max(group[0], stat.st_mtime)
+            group[1] += stat.st_size
+            group[2].append(entry.path)
+            total += stat.st_size
+        return groups, total
+
+    def evict(self, keep=()):
+        """
+        总大小超过上限时，按最近使用时间从旧到新删除整个分P的文件
+
+        Args:
+            keep: 不淘汰的分P (BV号, 分P号) 列表，如刚下载完、正要返回的视频
+
+        Returns:
+            list: 被删除了视频文件的分P (BV号, 分P号)，调用方据此重置course_parts.status
+        """
+        if not self.max_bytes or not os.path.isdir(self.cache_dir):
+            return []
+        evicted = []
+        with self.lock:
+            groups, total = self.scan()
+            for key, (_, size, paths) in sorted(groups.items(), key=lambda item: item[1][0]):
+                if total <= self.max_bytes:
+                    break
+                if key in keep:
+                    continue
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                if isinstance(key, tuple) and any(path.endswith('.mp4') for path in paths):
+                    evicted.append(key)
+                print(f"视频缓存超出上限，已删除: {', '.join(os.path.basename(path) for path in paths)}")
+        return evicted
@@ -121,7 +121,65 @@ ALGO_PORT = 3000
 LLM_HOST = "0.0.0.0"
 LLM_PORT = 8800
 
+# 访问B站的共享HTTP会话：默认超时（秒）、重试次数、退避系数和每个host的最大连接数
+HTTP_TIMEOUT = 15
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_POOL_SIZE = 10
+# 下载大文件、提取音频等阻塞任务的线程数
+BLOCKING_WORKERS = 8
+# 视频元数据的进程内缓存：有效秒数和最多缓存的视频数
+VIDEO_INFO_TTL = 600
+VIDEO_INFO_CACHE_SIZE = 1024
+# 视频下载的并发连接数和每个分段的大小（MB）
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_PIECE_SIZE_MB = 16
+# 提取音频的格式：wav（16kHz单声道PCM）或opus（体积更小）
+AUDIO_FORMAT = "wav"
+# bilibili_video目录的磁盘上限（MB），超出时按最近播放时间淘汰视频及其音频、字幕，0 表示不限制
+VIDEO_CACHE_SIZE_MB = 51200
+# 返回视频时每次读取和发送的块大小（KB），ASGI服务器支持zero-copy时不使用
+VIDEO_CHUNK_SIZE_KB = 1024
+# 视频尚未下载完成时是否边下载边返回已下载的部分
+VIDEO_PROGRESSIVE = True
+# /video是否顺带在后台生成该分P的字幕、笔记和题目以及下一分P的字幕（请求中的prefetch可覆盖）
+VIDEO_PREFETCH = False
+# 每个进程的流水线中最多同时存在的任务数，超过时/video不再提交预生成
+PREFETCH_QUEUE_SIZE = 32
+# 分P处理流水线（POST /ingest和预生成共用）各阶段在本机所有worker进程中同时处理的最大分P数：
+# 下载视频、提取音频、ASR识别、生成笔记、生成题目
+PIPELINE_DOWNLOAD_CONCURRENCY = 2
+PIPELINE_AUDIO_CONCURRENCY = 2
+PIPELINE_ASR_CONCURRENCY = 1
+PIPELINE_NOTES_CONCURRENCY = 2
+PIPELINE_QUIZ_CONCURRENCY = 2
+# 流水线中每个阶段失败后的重试次数，重试间隔从5秒开始翻倍
+PIPELINE_RETRIES = 2
+
 ASR_HOST='0.0.0.0'
 ASR_PORT=5000
+# 每批送入ASR模型的语音片段数，1 即逐段识别
+ASR_BATCH_SIZE = 8
+# ASR异步任务的后台线程数和排队上限；使用进程池时线程数不应少于ASR_WORKERS
+ASR_JOB_WORKERS = 1
+ASR_JOB_QUEUE_SIZE = 16
+# ASR工作进程数，0 表示在主进程中识别；大于0时每个进程各自加载模型
+ASR_WORKERS = 0
+# 每个工作进程的torch线程数，0 表示按CPU核数均分
+ASR_THREADS_PER_WORKER = 0
+# ASR结果缓存的磁盘上限（MB），按最近使用淘汰
+ASR_CACHE_SIZE_MB = 1024
+# 跨请求动态批处理（仅ASR_WORKERS=0时生效）：凑满ASR_MAX_BATCH_SIZE个片段或等待ASR_MAX_WAIT_MS毫秒后统一识别
+ASR_SCHEDULER = False
+ASR_MAX_BATCH_SIZE = 16
+ASR_MAX_WAIT_MS = 20
+# /asr/windowed 的窗口长度和相邻窗口的重叠（秒），重叠应长于VAD的最长片段（20秒）
+ASR_WINDOW_SECONDS = 600
+ASR_WINDOW_OVERLAP_SECONDS = 30
+# VAD片段后处理：间隔不超过ASR_MERGE_MAX_GAP_MS的相邻片段合并到ASR_MERGE_TARGET_MS以内（0 不合并），
+# 超过ASR_SPLIT_MAX_MS的片段均分拆开（0 不拆分）；均可通过/asr的同名小写参数按请求覆盖
+ASR_MERGE_TARGET_MS = 8000
+ASR_MERGE_MAX_GAP_MS = 800
+ASR_SPLIT_MAX_MS = 20000
 
 
@@ -1,9 +1,13 @@
 import requests
+import hashlib
 import json
-from settings import BILIBILI_COOKIE
+import time
+from settings import BILIBILI_COOKIE, ASR_URL
 
 # 测试服务器地址
 BACKEND_URL = "http://localhost:3000"  # FastAPI服务器
+# ASR测试使用的音频，可先运行test_subtitle生成
+AUDIO_PATH = "./bilibili_video/BV1wy4y1D7JT_p3_audio.wav"
 
 
 def test_video():
@@ -123,6 +127,97 @@ def test_quiz():
     except Exception as e:
         print(f"测试题目生成失败: {str(e)}")
 
+def test_video_get():
+    """测试GET视频接口和Range请求"""
+    try:
+        print("\n=== 测试GET视频 ===")
+        url = f"{BACKEND_URL}/video/BV1wy4y1D7JT?p=3"
+        response = requests.get(url, headers={"Range": "bytes=0-1023"})
+        if response.status_code == 206:
+            print(f"Range请求成功: {response.headers.get('Content-Range')}, {len(response.content)}字节")
+        else:
+            print(f"请求失败: {response.status_code} {response.text[:200]}")
+    except Exception as e:
+        print(f"测试GET视频失败: {str(e)}")
+
+def test_ingest():
+    """测试整个系列的批量预处理，并轮询进度"""
+    try:
+        print("\n=== 测试批量预处理 ===")
+        response = requests.post(
+            f"{BACKEND_URL}/ingest",
+            json={"url": "https://www.bilibili.com/video/BV1wy4y1D7JT", "cookie": BILIBILI_COOKIE}
+        )
+        if response.status_code != 200:
+            print(f"提交失败: {response.json()}")
+            return
+        print(response.json())
+        bv_number = response.json()['bv']
+        while True:
+            progress = requests.get(f"{BACKEND_URL}/ingest/{bv_number}").json()
+            for part in progress['parts']:
+                print(f"P{part['page']} status={part['status']} pipeline={part['pipeline']} stages={part['stages']} errors={part['errors']}")
+            if not progress['running']:
+                break
+            time.sleep(10)
+    except Exception as e:
+        print(f"测试批量预处理失败: {str(e)}")
+
+def test_asr_stream():
+    """测试ASR流式接口，每行一个字幕片段"""
+    try:
+        print("\n=== 测试ASR流式识别 ===")
+        with open(AUDIO_PATH, 'rb') as f:
+            response = requests.post(f"{ASR_URL}/stream", files={"file": f}, stream=True, timeout=7200)
+        for line in response.iter_lines():
+            if line:
+                print(json.loads(line))
+    except Exception as e:
+        print(f"测试ASR流式识别失败: {str(e)}")
+
+def test_asr_jobs():
+    """测试ASR异步任务：提交、轮询进度、获取结果"""
+    try:
+        print("\n=== 测试ASR异步任务 ===")
+        with open(AUDIO_PATH, 'rb') as f:
+            job = requests.post(f"{ASR_URL}/jobs", files={"file": f}, timeout=600).json()
+        print(job)
+        while job['status'] in ("queued", "running"):
+            time.sleep(5)
+            job = requests.get(f"{ASR_URL}/jobs/{job['job_id']}").json()
+            print(f"进度: {job['progress']}")
+        response = requests.get(f"{ASR_URL}/jobs/{job['job_id']}/result")
+        print(json.dumps(response.json(), ensure_ascii=False, indent=2))
+    except Exception as e:
+        print(f"测试ASR异步任务失败: {str(e)}")
+
+def test_asr_cache():
+    """测试按音频哈希查询ASR缓存，需先识别过该音频"""
+    try:
+        print("\n=== 测试ASR缓存 ===")
+        with open(AUDIO_PATH, 'rb') as f:
+            audio_hash = hashlib.sha256(f.read()).hexdigest()
+        response = requests.get(f"{ASR_URL}/cache/{audio_hash}")
+        if response.status_code == 200:
+            print("缓存命中:")
+            print(json.dumps(response.json(), ensure_ascii=False, indent=2))
+        else:
+            print(f"缓存未命中: {response.json()}")
+    except Exception as e:
+        print(f"测试ASR缓存失败: {str(e)}")
+
+def test_asr_windowed():
+    """测试超长音频接口，请求体直接上传音频字节"""
+    try:
+        print("\n=== 测试ASR分窗识别 ===")
+        with open(AUDIO_PATH, 'rb') as f:
+            response = requests.post(f"{ASR_URL}/windowed", data=f, stream=True, timeout=7200)
+        for line in response.iter_lines():
+            if line:
+                print(json.loads(line))
+    except Exception as e:
+        print(f"测试ASR分窗识别失败: {str(e)}")
+
 if __name__ == "__main__":
     # test_video()
     # test_subtitle()